@@ -10,19 +10,19 @@
 """
 from flask import request, session, g, redirect, url_for
 from flask.ext import admin
-from flask.ext.admin.datastore.mongoalchemy import MongoAlchemyDatastore
 
 from authz.application import mongo, openid
 from authz.models import User, Consumer, Policy
 from auth import (
     login_before_request, login_view, logout_view, login_required)
+from datastore import AuthzDatastore
 from forms import ConsumerForm, PolicyForm
 
 
 def init(app):
     """Initialize the admin integration with the Flask app."""
 
-    datastore = MongoAlchemyDatastore(
+    datastore = AuthzDatastore(
         (User, Consumer, Policy),
         mongo.session,
         model_forms={
@@ -0,0 +1,42 @@
+import mongoalchemy as ma
+from flask.ext.admin.datastore.mongoalchemy import MongoAlchemyDatastore
+
+from authz.cache import invalidate_consumer, invalidate_policies
+from authz.models import Consumer, Policy
+
+
+class AuthzDatastore(MongoAlchemyDatastore):
+    """Datastore which keeps the application caches in sync with the changes
+    made through the admin tool."""
+
+    def update_from_form(self, model_instance, form):
+        """Invalidate the cached data for the values about to be replaced."""
+        self._changed(model_instance)
+        return super(AuthzDatastore, self).update_from_form(
+            model_instance, form)
+
+    def save_model(self, model_instance):
+        """Save the instance and invalidate the cached data for it."""
+        result = super(AuthzDatastore, self).save_model(model_instance)
+        self._changed(model_instance)
+        return result
+
+    def delete_model_instance(self, model_name, model_keys):
+        """Delete the instance and invalidate the cached data for it."""
+        try:
+            model_instance = self.find_model_instance(model_name, model_keys)
+        except ma.query.BadResultException:
+            return False
+
+        self.db_session.remove(model_instance)
+        self._changed(model_instance)
+        return True
+
+    def _changed(self, model_instance):
+        """Invalidate the cached data for the specified model instance."""
+        if isinstance(model_instance, Consumer):
+            if getattr(model_instance, 'key', None):
+                invalidate_consumer(model_instance.key)
+        elif isinstance(model_instance, Policy):
+            if getattr(model_instance, 'consumer_key', None):
+                invalidate_policies(model_instance.consumer_key)
@@ -1,3 +1,4 @@
 from rest import rest_endpoints
 from authorize import authorize_endpoints
 from authenticate import authenticate_endpoints
+from gateway import gateway_endpoints
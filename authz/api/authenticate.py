@@ -8,24 +8,23 @@
     :copyright: (c) 2012 by Ion Scerbatiuc
     :license: BSD
 """
-import oauth2 as oauth
-from cStringIO import StringIO
-from urlparse import urlparse
 from urllib import unquote_plus
+from urlparse import parse_qsl
+from StringIO import StringIO
 
-from flask import Blueprint, Request, request, abort, jsonify
+from flask import Blueprint, request, abort, jsonify, json
+from werkzeug.wsgi import LimitedStream
+from werkzeug.http import parse_options_header
+from werkzeug.datastructures import Headers
 
-from authz.models import Consumer
+from authz import signature
+from authz.cache import get_consumer, get_consumers
+from authz.nonces import nonce_checker
 
 
 authenticate_endpoints = Blueprint('authenticate_endpoints', __name__)
 
 
-oauth_server = oauth.Server(
-    signature_methods={'HMAC-SHA1': oauth.SignatureMethod_HMAC_SHA1()}
-)
-
-
 @authenticate_endpoints.route(
     '/<path:url>',
     methods=["GET", "POST", "PUT", "DELETE"])
@@ -35,50 +34,189 @@ def index(url):
     If the request is authenticated the consumer details are returned as a json
     document in the body.
     """
-    original_request = _request_from_url(unquote_plus(url), request)
-    oauth_request = oauth.Request.from_request(
-        original_request.method,
-        original_request.url,
-        headers=request.headers,
-        parameters=dict(
-            [(k, v) for k, v in original_request.values.iteritems()]
-        ))
-
-    if not oauth_request:
-        abort(401)
+    status, consumer = authenticate(unquote_plus(url), request)
+    if status != 202:
+        abort(status)
 
-    try:
-        consumer_key = oauth_request.get_parameter('oauth_consumer_key')
-    except oauth.Error:
-        abort(401)
+    response = jsonify(name=consumer.name, key=consumer.key)
+    response.status_code = 202
+    return response
+
+
+def authenticate(url, current_request):
+    """Verify the 2-legged oauth request described by the URL and the
+    current request.
+
+    The method, Authorization header and body of the current request are
+    used. The body is only parsed if it is form encoded, since only then its
+    parameters are part of the signature. Otherwise, if the request has an
+    oauth_body_hash, the body is streamed through the hash function.
+
+    The (status, consumer) tuple is returned: 202 and the ConsumerInfo if the
+    request is authenticated, 401 and None otherwise. Replayed requests are
+    not authenticated. The function is shared by the authenticate view and
+    the WSGI fast path.
+    """
+    form = None
+    if current_request.mimetype == signature.FORM_CONTENT_TYPE:
+        form = current_request.form
 
-    consumer = Consumer.query.filter(Consumer.key == consumer_key).first()
+    try:
+        signed_request = signature.SignedRequest(
+            current_request.method, url,
+            authorization=current_request.headers.get('Authorization'),
+            form=form)
+    except signature.SignatureError:
+        return 401, None
+
+    consumer = None
+    if signed_request.consumer_key:
+        consumer = get_consumer(signed_request.consumer_key)
     if not consumer:
-        abort(401)
+        return 401, None
+
+    if not _verify(signed_request, consumer, _body_stream(current_request)):
+        return 401, None
+
+    return 202, consumer
 
+
+def _verify(signed_request, consumer, body_stream):
+    """Check that the request is signed by the consumer and is not a replay.
+    """
     try:
-        oauth_server.verify_request(oauth_request, consumer, None)
-    except oauth.Error:
-        abort(401)
+        signature.verify(signed_request, consumer.secret)
+        signature.verify_body_hash(signed_request, body_stream)
+    except signature.SignatureError:
+        return False
 
-    response = jsonify(name=consumer.name, key=consumer.key)
-    response.status_code = 202
-    return response
+    # the nonce is only recorded for properly signed requests
+    return nonce_checker.add(
+        consumer.key,
+        signed_request.oauth_parameters.get('oauth_nonce'),
+        int(signed_request.get('oauth_timestamp')))
 
 
-def _request_from_url(url, current_request):
-    """Build a Request instance based on the URL and the current request.
+def _body_stream(current_request):
+    """Return the raw body of the current request as a stream.
 
-    The current request is the originating request from were we extract
-    information such as body, content type and method.
+    The WSGI input is wrapped directly, so that the body is never buffered
+    or parsed, whatever its content type.
+    """
+    length = current_request.headers.get('Content-Length', type=int)
+    return LimitedStream(
+        current_request.environ['wsgi.input'], max(length or 0, 0))
+
+
+@authenticate_endpoints.route('/', methods=["POST"])
+def batch():
+    """Verify a list of 2-legged oauth requests at once.
+
+    This method requires a JSON payload containing the list of requests,
+    each one described by its method, full URL and, optionally, its headers
+    and body. Only the Authorization and Content-Type headers are used.
+    :: For example:
+        [
+            {"method": "GET",
+             "url": "http://api.pbs.org/1.0/stations/?format=json",
+             "headers": {"Authorization": "OAuth oauth_consumer_key=..."}},
+            {"method": "POST",
+             "url": "http://api.pbs.org/1.0/stations/?oauth_consumer_key=...",
+             "headers": {"Content-Type":
+                             "application/x-www-form-urlencoded"},
+             "body": "title=Test+Station&tvcode=TSTA"}
+        ]
+
+    All the consumers are loaded using a single query. One result is
+    returned for every request, in the same order, with the status code of
+    the single request endpoint and the consumer details if the request is
+    authenticated.
     """
-    parts = urlparse(url)
-
-    return Request.from_values(
-        base_url="%s://%s" % (parts.scheme, parts.netloc),
-        path=parts.path,
-        query_string=parts.query,
-        content_length=len(current_request.data),
-        input_stream=StringIO(current_request.data),
-        content_type=current_request.content_type,
-        method=current_request.method)
+    entries = _load_entries(request.data)
+
+    signed_requests = []
+    for method, url, headers, body in entries:
+        form = None
+        if parse_options_header(headers.get('Content-Type', ''))[0] == \
+                signature.FORM_CONTENT_TYPE:
+            form = parse_qsl(body, keep_blank_values=True)
+
+        try:
+            signed_requests.append(signature.SignedRequest(
+                method, url,
+                authorization=headers.get('Authorization'),
+                form=form))
+        except signature.SignatureError:
+            signed_requests.append(None)
+
+    consumers = get_consumers([
+        signed_request.consumer_key
+        for signed_request in signed_requests
+        if signed_request and signed_request.consumer_key])
+
+    objects = []
+    for entry, signed_request in zip(entries, signed_requests):
+        consumer = None
+        if signed_request:
+            consumer = consumers.get(signed_request.consumer_key)
+
+        if not consumer or not _verify(
+                signed_request, consumer, StringIO(entry[3])):
+            objects.append({"status": 401})
+            continue
+
+        objects.append({
+            "name": consumer.name,
+            "key": consumer.key,
+            "status": 202
+        })
+
+    return jsonify(objects=objects)
+
+
+def _load_entries(data):
+    """Parse the requests from the JSON payload of a batch request.
+
+    A list of (method, url, headers, body) tuples is returned, where the
+    headers are a werkzeug Headers object and the body is a UTF-8 encoded
+    string. The request is aborted with 400 if the payload is not a list of
+    valid requests.
+    """
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        abort(400, "Invalid JSON payload")
+
+    if not isinstance(payload, list):
+        abort(400, "The payload must be a list of requests")
+
+    entries = []
+    for entry in payload:
+        if not isinstance(entry, dict):
+            abort(400, "Invalid request: %s" % json.dumps(entry))
+
+        missing_fields = []
+        for required_field in ("method", "url"):
+            value = entry.get(required_field)
+            if not value or not isinstance(value, basestring):
+                missing_fields.append(required_field)
+
+        if missing_fields:
+            abort(400, "Missing required fields: %s" % (
+                ", ".join(missing_fields)))
+
+        headers = entry.get("headers") or {}
+        body = entry.get("body") or ""
+        if not isinstance(headers, dict) or \
+                not isinstance(body, basestring) or \
+                not all(isinstance(value, basestring)
+                        for value in headers.itervalues()):
+            abort(400, "Invalid request: %s" % json.dumps(entry))
+
+        entries.append((
+            entry["method"],
+            entry["url"],
+            Headers(headers.items()),
+            body.encode("utf-8")))
+
+    return entries
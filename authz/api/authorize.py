@@ -8,10 +8,12 @@
     :copyright: (c) 2012 by Ion Scerbatiuc
     :license: BSD
 """
-from flask import Blueprint, request, abort
+from flask import Blueprint, request, abort, jsonify, json
 
-from authz.application import mongo
-from authz.models import Consumer, Policy
+from authz import store
+from authz.cache import get_consumer, decision_cache
+from authz.matching import POLICY_ACTION_BITS, rid_filters
+from authz.index import policy_index
 
 
 authorize_endpoints = Blueprint('authorize_endpoints', __name__)
@@ -24,48 +26,207 @@ def index(consumer_key, service, resource):
     """Authorize the specified consumer to use a particular service.
 
     We also check for wildcard patterns when searching through the existing
-    policies so 'resource/*' would give access to 'resource/resource-id'.
+    policies so 'resource/*' would give access to 'resource/resource-id' and
+    'resource/**' would give access to 'resource/resource-id/subresource'.
+
+    If the policy index is enabled the decision is taken without querying the
+    database. Otherwise the recent decisions are served from the decision
+    cache and the policies are queried only on cache misses.
     """
-    consumer = Consumer.query.filter(Consumer.key == consumer_key).first()
+    status = authorize(
+        consumer_key, service, resource, request.method.lower())
+    if status != 202:
+        abort(status)
+
+    return "", 202
+
+
+def authorize(consumer_key, service, resource, action):
+    """Return the status code of the authorize request.
+
+    The status is 202 if the action is allowed, 403 if it is not allowed,
+    401 if the consumer doesn't exist and 400 if the resource is invalid. The
+    function is shared by the authorize view and the WSGI fast path.
+    """
+    if policy_index.enabled:
+        consumer = policy_index.get_consumer(consumer_key)
+    else:
+        consumer = get_consumer(consumer_key)
+
     if not consumer:
-        abort(401)
+        return 401
+
+    return decide(consumer.key, service, resource, action)
 
+
+def decide(consumer_key, service, resource, action):
+    """Return the status code of the decision for an existing consumer.
+
+    The status is 202 if the action is allowed, 403 if it is not allowed and
+    400 if the resource is invalid.
+    """
+    if policy_index.enabled:
+        try:
+            allowed = policy_index.is_allowed(
+                consumer_key, service, resource, action)
+        except ValueError:
+            return 400
+
+        return allowed and 202 or 403
+
+    cache_key = (consumer_key, service, resource, action)
+    allowed = decision_cache.get(cache_key)
+    if allowed is None:
+        try:
+            rids = list(rid_filters(service, resource))
+        except ValueError:
+            return 400
+
+        generation = decision_cache.generation(consumer_key)
+        allowed = store.has_policy(consumer_key, rids, action)
+        decision_cache.set_decision(cache_key, allowed, generation)
+
+    return allowed and 202 or 403
+
+
+@authorize_endpoints.route('/<consumer_key>/', methods=["POST"])
+def batch(consumer_key):
+    """Authorize the specified consumer for a list of checks at once.
+
+    This method requires a JSON payload containing the list of checks.
+    :: For example:
+        [
+            {"service": "pbs:api", "resource": "station/bbmedia",
+             "action": "get"},
+            {"service": "pbs:api", "resource": "program/nova",
+             "action": "put"}
+        ]
+
+    The consumer is loaded only once and all the checks are resolved using a
+    single policy query (or a single pass through the policy index). One
+    decision is returned for every check, in the same order, using the status
+    codes of the single check endpoint.
+    """
+    checks = _load_checks(request.data)
+
+    if policy_index.enabled:
+        if not policy_index.get_consumer(consumer_key):
+            abort(401)
+        statuses = _batch_from_index(consumer_key, checks)
+    else:
+        consumer = get_consumer(consumer_key)
+        if not consumer:
+            abort(401)
+        statuses = _batch_from_db(consumer.key, checks)
+
+    objects = []
+    for (service, resource, action), status in zip(checks, statuses):
+        objects.append({
+            "service": service,
+            "resource": resource,
+            "action": action,
+            "status": status
+        })
+
+    return jsonify(objects=objects)
+
+
+def _load_checks(data):
+    """Parse the checks from the JSON payload of a batch request.
+
+    A list of (service, resource, action) tuples is returned. The request is
+    aborted with 400 if the payload is not a list of valid checks.
+    """
     try:
-        rid_query = _build_rid_query(service, resource, request.method.lower())
+        payload = json.loads(data)
     except ValueError:
-        abort(500)
+        abort(400, "Invalid JSON payload")
 
-    query = {"consumer_key": consumer.key}
-    query.update(rid_query)
-    policies = mongo.session.query(Policy).filter(query)
+    if not isinstance(payload, list):
+        abort(400, "The payload must be a list of checks")
 
-    if not policies.first():
-        abort(403)
-
-    return "", 202
+    checks = []
+    for check in payload:
+        if not isinstance(check, dict):
+            abort(400, "Invalid check: %s" % json.dumps(check))
 
+        missing_fields = []
+        for required_field in ("service", "resource", "action"):
+            value = check.get(required_field)
+            if not value or not isinstance(value, basestring):
+                missing_fields.append(required_field)
 
-def _build_rid_query(service, resource, action):
-    """Create the rid query filters for policies.
+        if missing_fields:
+            abort(400, "Missing required fields: %s" % (
+                ", ".join(missing_fields)))
 
-    Currently only resources in the following format are supported:
-      * resource/resourceid
+        checks.append((
+            check["service"],
+            check["resource"].strip("/"),
+            check["action"].lower()))
 
-    You can also specify wildcards for resource parts but the / is mandatory
-    in the expression.
-    """
-    resource_parts = resource.split("/")
-    if len(resource_parts) < 2:
-        raise ValueError()
+    return checks
 
-    filters = tuple(set([
-        "rid:%s:*/*" % service,
-        "rid:%s:%s/*" % (service, resource_parts[0]),
-        "rid:%s:%s/%s" % (service, resource_parts[0], resource_parts[1])
-    ]))
 
-    query_expression = []
-    for filter in filters:
-        query_expression.append({"rid": filter, "actions": action})
+def _batch_from_db(consumer_key, checks):
+    """Resolve the batch checks using a single policy query.
 
-    return {"$or": query_expression}
+    The checks found in the decision cache are not included in the query.
+    """
+    decisions = []
+    filters = []
+    for service, resource, action in checks:
+        allowed = decision_cache.get((consumer_key, service, resource, action))
+        decisions.append(allowed)
+        if allowed is not None:
+            filters.append(())
+            continue
+
+        try:
+            filters.append(rid_filters(service, resource))
+        except ValueError:
+            filters.append(None)
+
+    rids = set()
+    for check_filters in filters:
+        rids.update(check_filters or ())
+
+    granted = {}
+    generation = decision_cache.generation(consumer_key)
+    if rids:
+        granted = store.find_policy_masks(consumer_key, list(rids))
+
+    statuses = []
+    for check, allowed, check_filters in zip(checks, decisions, filters):
+        if check_filters is None:
+            statuses.append(400)
+            continue
+
+        if allowed is None:
+            mask = 0
+            for rid in check_filters:
+                mask |= granted.get(rid, 0)
+
+            allowed = bool(mask & POLICY_ACTION_BITS.get(check[2], 0))
+            decision_cache.set_decision(
+                (consumer_key,) + check, allowed, generation)
+
+        statuses.append(allowed and 202 or 403)
+
+    return statuses
+
+
+def _batch_from_index(consumer_key, checks):
+    """Resolve the batch checks using the in-process policy index."""
+    statuses = []
+    for service, resource, action in checks:
+        try:
+            allowed = policy_index.is_allowed(
+                consumer_key, service, resource, action)
+        except ValueError:
+            statuses.append(400)
+            continue
+
+        statuses.append(allowed and 202 or 403)
+
+    return statuses
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.api.gateway
+    ~~~~~~~~~~~~~~~~~
+
+    Define the views for the gateway endpoints, which authenticate and
+    authorize a request in a single round trip.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+from urlparse import urlsplit
+from urllib import unquote, unquote_plus
+
+from flask import Blueprint, request, abort, jsonify
+
+from authz.api.authenticate import authenticate
+from authz.api.authorize import decide
+
+
+gateway_endpoints = Blueprint('gateway_endpoints', __name__)
+
+
+@gateway_endpoints.route(
+    '/<service>/<path:url>',
+    methods=["GET", "POST", "PUT", "DELETE"])
+def index(service, url):
+    """Authenticate the 2-legged oauth request using the specified URL and
+    authorize the consumer to perform it.
+
+    The request is authenticated the same way the authenticate endpoint does
+    it and 401 is returned if it fails. The resource is the decoded path of
+    the URL, without the leading and trailing slashes, so it is checked just
+    like the resource of the authorize endpoints. The action is the request
+    method. The consumer details and the decision are returned as a json
+    document, using the status code of the decision.
+    :: For example:
+        {
+            "name": "Consumer ABC",
+            "key": "ABC",
+            "service": "pbs:api",
+            "resource": "stations/42",
+            "action": "get",
+            "status": 202
+        }
+    """
+    url = unquote_plus(url)
+    status, consumer = authenticate(url, request)
+    if status != 202:
+        abort(status)
+
+    # decoded the same way werkzeug decodes the authorize endpoint paths
+    path = urlsplit(url).path.encode("utf-8")
+    resource = unquote(path).decode("utf-8", "replace").strip("/")
+    action = request.method.lower()
+    status = decide(consumer.key, service, resource, action)
+
+    response = jsonify(
+        name=consumer.name,
+        key=consumer.key,
+        service=service,
+        resource=resource,
+        action=action,
+        status=status)
+    response.status_code = status
+    return response
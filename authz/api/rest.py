@@ -8,19 +8,104 @@
     :copyright: (c) 2012 by Ion Scerbatiuc
     :license: BSD
 """
-from flask import Blueprint, request, url_for, abort, jsonify, json, g
+from itertools import islice
+
+from flask import (
+    Blueprint, Response, request, url_for, abort, jsonify, json, g,
+    current_app)
 from flask.views import MethodView
+from werkzeug.urls import url_quote
+from werkzeug.utils import cached_property
+from mongoalchemy.exceptions import BadValueException
 
+from authz import store, bulk
 from authz.models import Consumer, Policy
+from authz.matching import POLICY_ACTION_CHOICES, rid_filters
+from authz.cache import (
+    consumer_cache, decision_cache, invalidate_consumer, invalidate_policies)
 
 
 rest_endpoints = Blueprint('rest_endpoints', __name__)
 
 
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+"""The content type of the streamed lists, one JSON object per line."""
+
+
+URL_PLACEHOLDER = "__authz_url_placeholder__"
+"""The value used for building the URL templates, which must be left
+unchanged by the URL quoting."""
+
+
+class URLTemplate(object):
+    """The URL of an endpoint with a single variable part.
+
+    The URL is built once using url_for and then filled in by concatenating
+    the quoted values, which is much cheaper than going through the URL map
+    for every object of a list response.
+    """
+
+    def __init__(self, endpoint, name, **values):
+        values[name] = URL_PLACEHOLDER
+        url = url_for(endpoint, **values)
+        self.prefix, _, self.suffix = url.partition(URL_PLACEHOLDER)
+        self.charset = current_app.url_map.charset
+
+    def __call__(self, value):
+        """Return the URL for the value of the variable part."""
+        return self.prefix + url_quote(value, self.charset) + self.suffix
+
+
 class BaseApi(MethodView):
-    """Base class for the API views."""
+    """Base class for the API views.
+
+    The subclasses define the serialized fields in FIELDS, mapped to the
+    model fields they are built from, and serialize the objects using the
+    _serialize method. A new view object is created for every request, so
+    the URL templates are resolved once per request.
+    """
+
+    FIELDS = {}
+
+    @cached_property
+    def consumer_url(self):
+        """The URL template of the consumer resources."""
+        return URLTemplate("rest_endpoints.consumers", "consumer_key")
 
-    def jsonify(self, obj, status_code=200):
+    @cached_property
+    def policies_url(self):
+        """The URL template of the policy lists of the consumers."""
+        return URLTemplate("rest_endpoints.policies", "consumer_key")
+
+    def requested_fields(self):
+        """Return the set of fields to serialize.
+
+        The fields are given as a comma separated list by the fields argument
+        of the request, for example ?fields=key,name. All the fields are
+        serialized if the argument is missing.
+        """
+        value = request.args.get("fields")
+        if not value:
+            return frozenset(self.FIELDS)
+
+        fields = frozenset(
+            name.strip() for name in value.split(",") if name.strip())
+        invalid_fields = sorted(fields.difference(self.FIELDS))
+        if invalid_fields or not fields:
+            abort(400, "Invalid fields: %s" % (
+                ", ".join(invalid_fields) or value))
+
+        return fields
+
+    def project(self, query, fields, *extra_fields):
+        """Load only the model fields needed for serializing the fields and
+        the extra model fields, like the ones used for sorting.
+        """
+        names = set(self.FIELDS[name] for name in fields)
+        names.update(extra_fields)
+        return query.fields(*names)
+
+    def jsonify(self, obj, status_code=200, etag=None):
         """Return a JSON response using the specified mapping.
 
         The specified mapping must be a valid python mapping or an
@@ -30,44 +115,171 @@ class BaseApi(MethodView):
 
         response = jsonify(obj)
         response.status_code = status_code
+        if etag:
+            response.set_etag(etag)
         return response
 
+    def revision_etag(self, consumer_key):
+        """Return the ETag of the resources of the consumer.
+
+        The ETag is derived from the consumer revision, which is bumped by
+        every change of the consumer or of its policies.
+        """
+        return "%s.%d" % (consumer_key, store.get_revision(consumer_key))
+
+    def not_modified(self, etag):
+        """Return a 304 response if the request has a matching If-None-Match
+        header, None otherwise.
+        """
+        if etag not in request.if_none_match:
+            return None
+
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    def page_limit(self):
+        """Return the page size given by the limit argument of the request,
+        bounded by the API_MAX_PAGE_SIZE setting.
+        """
+        config = current_app.config
+        try:
+            limit = int(request.args.get("limit", config['API_PAGE_SIZE']))
+        except ValueError:
+            abort(400, "Invalid limit: %s" % request.args["limit"])
+
+        if limit < 1:
+            abort(400, "Invalid limit: %s" % limit)
+        return min(limit, config['API_MAX_PAGE_SIZE'])
+
+    def paginate(self, query, field_name, fields, endpoint, **values):
+        """Return a page of the query results, ready for jsonify.
+
+        The results are sorted by the specified field, which must be unique
+        within the query and backed by an index. The page size is given by
+        page_limit and the page starts after the field value given by the
+        after argument. If there are more results, the payload contains the
+        URL of the next page, built for the endpoint using the values. Only
+        the specified fields of the objects are serialized.
+        :: For example:
+            {
+                "objects": [...],
+                "next": "/api/1.0/consumers/?after=XYZ&limit=100"
+            }
+        """
+        limit = self.page_limit()
+
+        # one extra result tells whether there is a next page
+        query = self._sorted_after(query, field_name)
+        results = list(query.limit(limit + 1))
+
+        payload = {
+            "objects": [
+                self._serialize(obj, fields) for obj in results[:limit]],
+            "next": None
+        }
+        if len(results) > limit:
+            if "fields" in request.args:
+                values["fields"] = request.args["fields"]
+
+            payload["next"] = url_for(
+                endpoint, limit=limit,
+                after=getattr(results[limit - 1], field_name), **values)
+
+        return payload
+
+    def stream(self, query, field_name, fields):
+        """Return a response streaming all the query results as NDJSON.
+
+        The results are sorted by the specified field and can start after
+        the field value given by the after argument, like the pages. Only the
+        specified fields are serialized, one object at a time while the
+        cursor is iterated, so the memory use doesn't depend on the number of
+        results.
+        """
+        query = self._sorted_after(query, field_name)
+        app = current_app._get_current_object()
+        environ = request.environ
+
+        def generate():
+            # the request context is gone once the view returns, but it is
+            # needed for building the URLs of the serialized objects
+            with app.request_context(environ):
+                for obj in query:
+                    yield json.dumps(self._serialize(obj, fields)) + "\n"
+
+        return Response(generate(), mimetype=NDJSON_CONTENT_TYPE)
+
+    def _sorted_after(self, query, field_name):
+        """Sort the query by the field and skip the results up to the field
+        value given by the after argument of the request, if any.
+        """
+        field = getattr(query.type, field_name)
+        after = request.args.get("after")
+        if after is not None:
+            query = query.filter(field > after)
+
+        return query.ascending(field)
+
 
 class ConsumersApi(BaseApi):
     """API handlers for the consumers collection endpoint."""
 
-    def _serialize(self, consumer):
-        """Serialize the consumer object to be ready for jsonify."""
-        return {
-            "name": consumer.name,
-            "key": consumer.key,
-            "secret": consumer.secret,
-            "policies": url_for(
-                "rest_endpoints.policies",
-                consumer_key=consumer.key),
-            "resource_uri": url_for(
-                "rest_endpoints.consumers",
-                consumer_key=consumer.key)
-        }
+    FIELDS = {
+        "name": "name",
+        "key": "key",
+        "secret": "secret",
+        "policies": "key",
+        "resource_uri": "key"
+    }
+
+    def _serialize(self, consumer, fields=FIELDS):
+        """Serialize the consumer object to be ready for jsonify.
+
+        Only the specified fields are serialized, so the consumer can be
+        partially loaded.
+        """
+        data = {}
+        for name in ("name", "key", "secret"):
+            if name in fields:
+                data[name] = getattr(consumer, name)
+
+        if "policies" in fields:
+            data["policies"] = self.policies_url(consumer.key)
+        if "resource_uri" in fields:
+            data["resource_uri"] = self.consumer_url(consumer.key)
+        return data
 
     def get(self, consumer_key=None):
-        """Return the list of consumers in the system.
+        """Return the list of consumers in the system, sorted by key and
+        paginated using the limit and after arguments. All the consumers are
+        streamed as NDJSON instead if the format argument is 'ndjson'.
 
-        If consumer key is specified, return only the specified consumer.
+        If consumer key is specified, return only the specified consumer. Its
+        ETag is the consumer revision and a request with a matching
+        If-None-Match header gets a 304 response without loading it.
+
+        Use the fields argument to get only some of the fields, for example
+        ?fields=key,name. The other fields are not loaded from the database.
         """
+        fields = self.requested_fields()
         if consumer_key:
-            consumer = Consumer.query.filter(
+            etag = self.revision_etag(consumer_key)
+            response = self.not_modified(etag)
+            if response:
+                return response
+
+            consumer = self.project(Consumer.query.filter(
                 Consumer.key == consumer_key
-            ).first_or_404()
-            payload = self._serialize(consumer)
-        else:
-            payload = {
-                "objects": []
-            }
-            consumers = Consumer.query.filter()
-            for consumer in consumers:
-                payload["objects"].append(self._serialize(consumer))
+            ), fields).first_or_404()
+            return self.jsonify(self._serialize(consumer, fields), etag=etag)
 
+        query = self.project(Consumer.query.filter(), fields, "key")
+        if request.args.get("format") == "ndjson":
+            return self.stream(query, "key", fields)
+
+        payload = self.paginate(
+            query, "key", fields, "rest_endpoints.consumers")
         return self.jsonify(payload)
 
     def post(self):
@@ -83,6 +295,7 @@ class ConsumersApi(BaseApi):
 
         consumer = Consumer(name=payload["name"])
         consumer.save()
+        invalidate_consumer(consumer.key)
         return self.jsonify(self._serialize(consumer), status_code=201)
 
     def put(self, consumer_key):
@@ -101,6 +314,39 @@ class ConsumersApi(BaseApi):
                 setattr(consumer, attr, value)
 
         consumer.save()
+        invalidate_consumer(consumer.key)
+        return self.jsonify(self._serialize(consumer))
+
+    def patch(self, consumer_key):
+        """Change some of the attributes of an existing consumer.
+
+        This method requires a JSON payload containing the new values of the
+        name and / or secret. The consumer is changed using a single atomic
+        update and the updated consumer is returned.
+        :: For example:
+            {
+                "name": "New Name"
+            }
+        """
+        payload = json.loads(request.data)
+        if not isinstance(payload, dict) or not payload:
+            abort(400, "The payload must contain the changed fields")
+
+        fields = Consumer.get_fields()
+        for attr, value in payload.iteritems():
+            if attr not in ('name', 'secret'):
+                abort(400, "Field cannot be changed: %s" % attr)
+
+            try:
+                fields[attr].validate_wrap(value)
+            except BadValueException:
+                abort(400, "Invalid value for field: %s" % attr)
+
+        consumer = store.update_consumer(consumer_key, payload)
+        if consumer is None:
+            abort(404)
+
+        invalidate_consumer(consumer.key)
         return self.jsonify(self._serialize(consumer))
 
     def delete(self, consumer_key):
@@ -110,6 +356,7 @@ class ConsumersApi(BaseApi):
         ).first_or_404()
 
         consumer.remove()
+        invalidate_consumer(consumer.key)
         return '', 204
 
 
@@ -122,40 +369,74 @@ rest_endpoints.add_url_rule(
     view_func=consumers_view, methods=['POST'])
 rest_endpoints.add_url_rule(
     '/consumers/<consumer_key>/',
-    view_func=consumers_view, methods=['GET', 'PUT', 'DELETE'])
+    view_func=consumers_view, methods=['GET', 'PUT', 'PATCH', 'DELETE'])
 
 
 class PoliciesApi(BaseApi):
     """API handlers for the policies collection endpoint."""
 
-    def _serialize(self, policy):
-        """Serialize the policy object to be ready for jsonify."""
-        return {
-            "rid": policy.rid,
-            "actions": list(policy.actions),
-            "consumer": url_for(
-                "rest_endpoints.consumers",
-                consumer_key=policy.consumer_key)
-        }
+    FIELDS = {
+        "rid": "rid",
+        "actions": "actions",
+        "consumer": "consumer_key"
+    }
+
+    def _serialize(self, policy, fields=FIELDS):
+        """Serialize the policy object to be ready for jsonify.
+
+        Only the specified fields are serialized, so the policy can be
+        partially loaded.
+        """
+        data = {}
+        if "rid" in fields:
+            data["rid"] = policy.rid
+        if "actions" in fields:
+            data["actions"] = list(policy.actions)
+        if "consumer" in fields:
+            data["consumer"] = self.consumer_url(policy.consumer_key)
+        return data
 
     def get(self, consumer_key, rid=None):
-        """Return the list of policies for the specified consumer.
+        """Return the list of policies for the specified consumer, sorted by
+        resource id and paginated using the limit and after arguments. All
+        the policies are streamed as NDJSON instead if the format argument is
+        'ndjson'.
 
         If resource id is specified, return only that policy.
+
+        The ETag is the consumer revision, which changes with every policy of
+        the consumer, and a request with a matching If-None-Match header gets
+        a 304 response without querying the policies.
+
+        Use the fields argument to get only some of the fields, for example
+        ?fields=rid,actions. The other fields are not loaded from the
+        database.
         """
+        fields = self.requested_fields()
+        etag = self.revision_etag(consumer_key)
+        response = self.not_modified(etag)
+        if response:
+            return response
+
         if rid:
-            policy = Policy.query.filter(
+            policy = self.project(Policy.query.filter(
                 Policy.consumer_key == consumer_key,
                 Policy.rid == rid
-            ).first_or_404()
-            payload = self._serialize(policy)
-        else:
-            policies = Policy.query.filter(Policy.consumer_key == consumer_key)
-            payload = {"objects": []}
-            for policy in policies:
-                payload["objects"].append(self._serialize(policy))
-
-        return self.jsonify(payload)
+            ), fields).first_or_404()
+            return self.jsonify(self._serialize(policy, fields), etag=etag)
+
+        query = self.project(
+            Policy.query.filter(Policy.consumer_key == consumer_key),
+            fields, "rid")
+        if request.args.get("format") == "ndjson":
+            response = self.stream(query, "rid", fields)
+            response.set_etag(etag)
+            return response
+
+        payload = self.paginate(
+            query, "rid", fields, "rest_endpoints.policies",
+            consumer_key=consumer_key)
+        return self.jsonify(payload, etag=etag)
 
     def post(self, consumer_key):
         """Create a new policy definition for the specified consumer.
@@ -181,11 +462,19 @@ class PoliciesApi(BaseApi):
             abort(400, "Missing required fields: %s" % (
                 ", ".join(missing_fields)))
 
+        existing = Policy.query.filter(
+            Policy.consumer_key == consumer_key,
+            Policy.rid == payload["rid"]
+        ).first()
+        if existing:
+            abort(409, "Policy already exists: %s" % payload["rid"])
+
         policy = Policy(
             consumer_key=consumer_key,
             rid=payload["rid"],
             actions=set(payload["actions"]))
         policy.save()
+        invalidate_policies(consumer_key)
         return self.jsonify(self._serialize(policy), status_code=201)
 
     def put(self, consumer_key, rid):
@@ -209,8 +498,45 @@ class PoliciesApi(BaseApi):
 
         policy.actions = set(payload["actions"])
         policy.save()
+        invalidate_policies(consumer_key)
         return self.jsonify(self._serialize(policy), status_code=200)
 
+    def patch(self, consumer_key, rid):
+        """Change the actions of the specified policy.
+
+        This method requires a JSON payload containing either the new list of
+        actions, the actions to add or the actions to remove. The policy is
+        changed using a single atomic update, so concurrent changes of the
+        same policy are never lost, and the updated policy is returned.
+        :: For example:
+            {
+                "add_actions": ["put"]
+            }
+        """
+        payload = json.loads(request.data)
+        if not isinstance(payload, dict):
+            abort(400, "The payload must be a JSON object")
+
+        operations = [
+            name for name in ("actions", "add_actions", "remove_actions")
+            if name in payload]
+        if len(operations) != 1:
+            abort(400, "Exactly one of actions, add_actions or "
+                       "remove_actions is required")
+
+        actions = payload[operations[0]]
+        if not isinstance(actions, list) or any(
+                action not in POLICY_ACTION_CHOICES for action in actions):
+            abort(400, "Invalid actions: %s" % json.dumps(actions))
+
+        policy = store.update_policy(
+            consumer_key, rid, **{str(operations[0]): actions})
+        if policy is None:
+            abort(404)
+
+        invalidate_policies(consumer_key)
+        return self.jsonify(self._serialize(policy))
+
     def delete(self, consumer_key, rid):
         """Delete the policy definition from the specified consumer."""
         policy = Policy.query.filter(
@@ -219,6 +545,7 @@ class PoliciesApi(BaseApi):
         ).first_or_404()
 
         policy.remove()
+        invalidate_policies(consumer_key)
         return '', 204
 
 
@@ -231,7 +558,104 @@ rest_endpoints.add_url_rule(
     view_func=policies_view, methods=['POST'])
 rest_endpoints.add_url_rule(
     '/consumers/<consumer_key>/policies/<path:rid>/',
-    view_func=policies_view, methods=['GET', 'PUT', 'DELETE'])
+    view_func=policies_view, methods=['GET', 'PUT', 'PATCH', 'DELETE'])
+
+
+class AccessApi(BaseApi):
+    """API handler for the consumers allowed to access a resource."""
+
+    def get(self, service, resource):
+        """Return the consumers allowed to perform the action given by the
+        action argument on the resource, sorted by key and paginated using
+        the limit and after arguments.
+
+        The policies are matched using the same wildcard rules as the
+        authorize endpoints, so the policies for 'station/*' and 'station/**'
+        give access to 'station/bbmedia'. The rids of the matching policies
+        are returned for every consumer.
+        :: For example:
+            {
+                "objects": [{
+                    "key": "XYZ",
+                    "consumer": "/api/1.0/consumers/XYZ/",
+                    "rids": ["rid:pbs:api:station/*"]
+                }],
+                "next": null
+            }
+        """
+        action = request.args.get("action")
+        if not action:
+            abort(400, "Missing required argument: action")
+        if action not in POLICY_ACTION_CHOICES:
+            abort(400, "Invalid action: %s" % action)
+
+        try:
+            rids = rid_filters(service, resource)
+        except ValueError:
+            abort(400, "Invalid resource: %s" % resource)
+
+        # one extra consumer tells whether there is a next page
+        limit = self.page_limit()
+        results = list(islice(store.find_access(
+            rids, action, limit + 1, after=request.args.get("after")),
+            limit + 1))
+
+        payload = {
+            "objects": [{
+                "key": consumer_key,
+                "consumer": self.consumer_url(consumer_key),
+                "rids": policy_rids
+            } for consumer_key, policy_rids in results[:limit]],
+            "next": None
+        }
+        if len(results) > limit:
+            payload["next"] = url_for(
+                "rest_endpoints.access", service=service, resource=resource,
+                action=action, limit=limit, after=results[limit - 1][0])
+
+        return self.jsonify(payload)
+
+
+rest_endpoints.add_url_rule(
+    '/access/<service>/<path:resource>/',
+    view_func=AccessApi.as_view('access'), methods=['GET'])
+
+
+@rest_endpoints.route('/policies/import/', methods=['POST'])
+def import_policies():
+    """Import the policies of any consumers from an NDJSON payload.
+
+    This method requires an application/x-ndjson payload with one policy per
+    line. The body is read line by line and the policies are written in
+    batches of POLICY_IMPORT_BATCH_SIZE. Use the upsert argument to replace
+    the actions of the existing policies instead of reporting them as errors.
+    :: For example:
+        {"consumer_key": "XYZ", "rid": "rid:pbs:api:station/*",
+         "actions": ["get", "put"]}
+        {"consumer_key": "ABC", "rid": "rid:pbs:api:program/**",
+         "actions": ["get"]}
+
+    The number of created and updated policies and the errors of the lines
+    which were not imported are returned.
+    """
+    if request.mimetype != NDJSON_CONTENT_TYPE:
+        abort(415, "The payload must be %s" % NDJSON_CONTENT_TYPE)
+
+    # iterating the werkzeug LimitedStream directly never stops
+    report = bulk.import_policies(
+        iter(request.stream.readline, ""),
+        upsert=request.args.get("upsert") in ("1", "true"),
+        batch_size=current_app.config['POLICY_IMPORT_BATCH_SIZE'])
+    return jsonify(report)
+
+
+@rest_endpoints.route('/policies/export/')
+def export_policies():
+    """Stream the policies of all the consumers as NDJSON, in the format
+    accepted by the import endpoint.
+    """
+    return Response(
+        bulk.export_policies(), mimetype=NDJSON_CONTENT_TYPE)
 
 
 @rest_endpoints.route('/')
@@ -240,5 +664,18 @@ def api_index():
     return jsonify({
         "consumers": {
             "list_endpoint": url_for("rest_endpoints.consumers")
+        },
+        "policies": {
+            "import_endpoint": url_for("rest_endpoints.import_policies"),
+            "export_endpoint": url_for("rest_endpoints.export_policies")
         }
     })
+
+
+@rest_endpoints.route('/stats/')
+def stats():
+    """Return the hit and miss counters of the caches of this process."""
+    return jsonify({
+        "consumer_cache": consumer_cache.stats(),
+        "decision_cache": decision_cache.stats()
+    })
@@ -46,6 +46,9 @@ def create(extra_config=None, load_mongo=True, load_admin=True,
     if load_mongo or load_admin or load_rest_api or load_service_api:
         mongo.init_app(app)
 
+        import cache
+        cache.init_app(app)
+
     if load_admin:
         openid.init_app(app)
 
@@ -57,10 +60,32 @@ def create(extra_config=None, load_mongo=True, load_admin=True,
         app.register_blueprint(rest_endpoints, url_prefix='/api/1.0')
 
     if load_service_api:
-        from api import authorize_endpoints, authenticate_endpoints
+        from index import policy_index
+        policy_index.init_app(app)
+
+        from nonces import nonce_checker
+        nonce_checker.init_app(app)
+
+        from api import (
+            authorize_endpoints, authenticate_endpoints, gateway_endpoints)
         app.register_blueprint(authorize_endpoints, url_prefix='/authorize')
         app.register_blueprint(
             authenticate_endpoints,
             url_prefix='/authenticate')
+        app.register_blueprint(gateway_endpoints, url_prefix='/gateway')
 
     return app
+
+
+def create_fast_path(extra_config=None, **kwargs):
+    """Create the WSGI fast path for the authorize and authenticate endpoints.
+
+    The returned WSGI callable answers the authorize and authenticate
+    requests directly and passes all the other requests to a full Flask app,
+    created using the same arguments as create().
+    """
+    kwargs['load_service_api'] = True
+    app = create(extra_config=extra_config, **kwargs)
+
+    from fastpath import FastPathApp
+    return FastPathApp(app)
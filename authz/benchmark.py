@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.benchmark
+    ~~~~~~~~~~~~~~~
+
+    Micro-benchmark of the OAuth signature verification.
+
+    Run it with `python -m authz.benchmark`. The cost per request is reported
+    for signing with keyed HMAC objects created for every request, for signing
+    with the HMAC objects cached per consumer and for the whole verification.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import hmac
+import time
+import timeit
+import binascii
+
+from authz import signature
+
+
+def _signed_request(method, secret):
+    """Return a request signed by the consumer 'key' using the method."""
+    parameters = (
+        "?format=json&oauth_consumer_key=key&oauth_nonce=12345678"
+        "&oauth_signature_method=%s&oauth_timestamp=%d&oauth_version=1.0" % (
+            method, time.time()))
+    url = "http://api.pbs.org/1.0/stations/42/schedule/" + parameters
+    request = signature.SignedRequest("GET", url)
+
+    request.parameters.append(
+        ("oauth_signature", signature.sign(request, secret, method)))
+    request.oauth_parameters["oauth_signature"] = request.parameters[-1][1]
+    return request
+
+
+def _uncached_sign(request, consumer_secret, method="HMAC-SHA1"):
+    """Sign the request creating a new keyed HMAC object."""
+    key = "%s&" % signature.escape(consumer_secret)
+    digest = hmac.new(
+        key, request.base_string(),
+        signature.SIGNATURE_METHODS[method]).digest()
+    return binascii.b2a_base64(digest)[:-1]
+
+
+def _timeit(function, number):
+    """Return the best time per call of the function, in microseconds."""
+    seconds = min(timeit.repeat(function, repeat=3, number=number))
+    return seconds / number * 1000000
+
+
+def benchmark(number=20000):
+    """Print the signing and verification costs per request.
+
+    The signing costs are measured with and without the cached HMAC objects.
+    The verification also checks the OAuth parameters and always uses the
+    cached objects.
+    """
+    secret = signature.escape("s3cr3t!" * 7)
+
+    print "%-12s %14s %14s %14s" % (
+        "method", "uncached sign", "cached sign", "verify")
+    for method in sorted(signature.SIGNATURE_METHODS):
+        request = _signed_request(method, secret)
+        print "%-12s %12.2fus %12.2fus %12.2fus" % (
+            method,
+            _timeit(lambda: _uncached_sign(request, secret, method), number),
+            _timeit(lambda: signature.sign(request, secret, method), number),
+            _timeit(lambda: signature.verify(request, secret), number))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.bulk
+    ~~~~~~~~~~
+
+    Import and export the policies as NDJSON, one policy per line.
+    :: For example:
+        {"consumer_key": "XYZ", "rid": "rid:pbs:api:station/*",
+         "actions": ["get", "put"]}
+
+    The imported policies are validated line by line and written in batches:
+    a single query checks the consumers of a batch, a single query finds the
+    existing policies and the new ones are inserted using a single query.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+from flask import json
+from mongoalchemy.exceptions import BadValueException
+
+from authz import store
+from authz.models import Policy
+from authz.cache import invalidate_policies
+from authz.matching import (
+    POLICY_ACTION_CHOICES, actions_to_mask, mask_to_actions)
+
+
+IMPORT_BATCH_SIZE = 1000
+"""The default number of policies written by a single import query."""
+
+
+def export_policies():
+    """Iterate through all the policies as NDJSON lines."""
+    for consumer_key, rid, mask in store.iter_policies():
+        yield json.dumps({
+            "consumer_key": consumer_key,
+            "rid": rid,
+            "actions": mask_to_actions(mask)
+        }) + "\n"
+
+
+def import_policies(lines, upsert=False, batch_size=IMPORT_BATCH_SIZE):
+    """Import the policies from the NDJSON lines.
+
+    Existing policies are reported as errors, unless upsert is set, in which
+    case their actions are replaced. Blank lines are skipped. The lines which
+    cannot be imported don't stop the import; they are reported by number.
+    :: The report is a dict, for example:
+        {
+            "created": 2,
+            "updated": 0,
+            "errors": [{"line": 3, "error": "Consumer not found: ABC"}]
+        }
+    """
+    report = {"created": 0, "updated": 0, "errors": []}
+
+    batch = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+
+        try:
+            batch.append((number,) + _parse_policy(line))
+        except ValueError, e:
+            report["errors"].append({"line": number, "error": str(e)})
+            continue
+
+        if len(batch) >= batch_size:
+            _import_batch(batch, upsert, report)
+            batch = []
+
+    if batch:
+        _import_batch(batch, upsert, report)
+
+    report["errors"].sort(key=lambda error: error["line"])
+    return report
+
+
+def _parse_policy(line):
+    """Return the (consumer_key, rid, actions) tuple of the policy line.
+
+    A ValueError is raised if the line is not a valid policy.
+    """
+    try:
+        policy = json.loads(line)
+    except ValueError:
+        raise ValueError("Invalid JSON")
+
+    if not isinstance(policy, dict):
+        raise ValueError("The policy must be a JSON object")
+
+    missing_fields = []
+    for required_field in ("consumer_key", "rid"):
+        value = policy.get(required_field)
+        if not value or not isinstance(value, basestring):
+            missing_fields.append(required_field)
+
+    actions = policy.get("actions")
+    if not isinstance(actions, list):
+        missing_fields.append("actions")
+
+    if missing_fields:
+        raise ValueError(
+            "Missing required fields: %s" % ", ".join(missing_fields))
+
+    # the documents are inserted directly, so check the model constraints
+    fields = Policy.get_fields()
+    for field_name in ("consumer_key", "rid"):
+        try:
+            fields[field_name].validate_wrap(policy[field_name])
+        except BadValueException:
+            raise ValueError("Invalid value for field: %s" % field_name)
+
+    invalid_actions = [
+        action for action in actions if action not in POLICY_ACTION_CHOICES]
+    if invalid_actions:
+        raise ValueError("Invalid actions: %s" % json.dumps(invalid_actions))
+
+    return policy["consumer_key"], policy["rid"], sorted(set(actions))
+
+
+def _import_batch(batch, upsert, report):
+    """Write a batch of parsed policies and update the report."""
+    consumers = store.find_consumers(
+        set(consumer_key for _, consumer_key, _, _ in batch))
+    existing = store.find_policy_ids(
+        consumers, set(rid for _, _, rid, _ in batch))
+
+    pending = {}
+    updates = {}
+    changed_consumers = set()
+    for number, consumer_key, rid, actions in batch:
+        if consumer_key not in consumers:
+            report["errors"].append({
+                "line": number,
+                "error": "Consumer not found: %s" % consumer_key})
+            continue
+
+        key = (consumer_key, rid)
+        if (key in existing or key in pending) and not upsert:
+            report["errors"].append({
+                "line": number,
+                "error": "Policy already exists: %s" % rid})
+            continue
+
+        changed_consumers.add(consumer_key)
+        if key in existing:
+            # the last line of an existing policy wins, like for new ones
+            if existing[key] not in updates:
+                report["updated"] += 1
+            updates[existing[key]] = actions
+        elif key in pending:
+            pending[key][1].update(
+                actions=actions, actions_mask=actions_to_mask(actions))
+        else:
+            pending[key] = (number, {
+                "consumer_key": consumer_key,
+                "rid": rid,
+                "actions": actions,
+                "actions_mask": actions_to_mask(actions)
+            })
+
+    if pending:
+        documents = [document for _, document in pending.itervalues()]
+        failed = store.insert_policies(documents)
+        report["created"] += len(documents) - len(failed)
+
+        # policies created by someone else since the existing ones were found
+        for document in failed:
+            number = pending[(document["consumer_key"], document["rid"])][0]
+            report["errors"].append({
+                "line": number,
+                "error": "Policy already exists: %s" % document["rid"]})
+
+    # the existing policies are updated with one query per actions
+    policy_ids_by_actions = {}
+    for policy_id, actions in updates.iteritems():
+        policy_ids_by_actions.setdefault(tuple(actions), []).append(policy_id)
+
+    for actions, policy_ids in policy_ids_by_actions.iteritems():
+        store.set_policy_actions(policy_ids, actions)
+
+    for consumer_key in changed_consumers:
+        invalidate_policies(consumer_key)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.cache
+    ~~~~~~~~~~~
+
+    Define the in-process caches used by the service endpoints.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import time
+import threading
+from collections import OrderedDict
+
+from authz import store, signature
+
+
+class TTLCache(object):
+    """Thread safe LRU cache with expiring entries.
+
+    The cache holds at most `maxsize` entries, evicting the least recently
+    used one when full. Entries expire `ttl` seconds after being set. A cache
+    with a `maxsize` of 0 never stores anything.
+
+    The number of hits and misses is recorded for monitoring purposes.
+    """
+
+    def __init__(self, maxsize=1000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize, ttl):
+        """Change the size and TTL of the cache, dropping all the entries."""
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self.hits = 0
+            self.misses = 0
+            self._data.clear()
+
+    def get(self, key, default=None):
+        """Return the value cached for the key or default if missing."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                self.misses += 1
+                return default
+
+            # re-insert the entry to mark it as the most recently used
+            self._data[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Cache the value for the key.
+
+        The default TTL of the cache is used if ttl is not specified.
+        """
+        if self.maxsize <= 0:
+            return
+
+        if ttl is None:
+            ttl = self.ttl
+
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def _set(self, key, value, ttl):
+        """Cache the value for the key. The lock must be held."""
+        self._data.pop(key, None)
+        self._data[key] = (value, time.time() + ttl)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove the key from the cache, if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def purge(self, predicate):
+        """Remove all the entries whose key matches the predicate."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        """Remove all the entries from the cache."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return the hit and miss counters and the size of the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl
+        }
+
+
+class DecisionCache(TTLCache):
+    """Cache of authorize decisions.
+
+    The keys are (consumer_key, service, resource, action) tuples and the
+    values are booleans telling if the action is allowed or not. Allowed and
+    denied decisions are kept for different amounts of time.
+
+    Every consumer has a generation counter, incremented when its decisions
+    are purged. A decision computed from the policies read before a purge is
+    not cached, so a policy change racing with an authorize query cannot
+    leave the old decision in the cache.
+    """
+
+    def __init__(self, maxsize=10000, allow_ttl=30, deny_ttl=5):
+        super(DecisionCache, self).__init__(maxsize, allow_ttl)
+        self.deny_ttl = deny_ttl
+        self._generations = {}
+
+    def configure(self, maxsize, allow_ttl, deny_ttl):
+        """Change the size and TTLs of the cache, dropping all the entries."""
+        self.deny_ttl = deny_ttl
+        super(DecisionCache, self).configure(maxsize, allow_ttl)
+
+    def generation(self, consumer_key):
+        """Return the generation of the decisions of the consumer.
+
+        Read it before querying the policies and pass it to set_decision.
+        """
+        with self._lock:
+            return self._generations.get(consumer_key, 0)
+
+    def set_decision(self, key, allowed, generation=None):
+        """Cache the decision using the TTL matching its outcome.
+
+        If generation is specified, the decision is not cached when the
+        decisions of the consumer were purged since that generation was read.
+        """
+        if allowed:
+            ttl = self.ttl
+        else:
+            ttl = self.deny_ttl
+
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self._lock:
+            if (generation is not None and
+                    generation != self._generations.get(key[0], 0)):
+                return
+
+            self._set(key, allowed, ttl)
+
+    def purge_consumer(self, consumer_key):
+        """Remove all the decisions cached for the specified consumer."""
+        # the generation is changed first, so the decisions which are being
+        # computed from the old policies are either rejected or purged
+        with self._lock:
+            self._generations[consumer_key] = (
+                self._generations.get(consumer_key, 0) + 1)
+
+        self.purge(lambda key: key[0] == consumer_key)
+
+    def stats(self):
+        """Return the cache stats, including the TTL for denied decisions."""
+        stats = super(DecisionCache, self).stats()
+        stats["deny_ttl"] = self.deny_ttl
+        return stats
+
+
+consumer_cache = TTLCache()
+"""Cache of ConsumerInfo objects, by consumer key."""
+
+
+decision_cache = DecisionCache()
+"""Cache of authorize decisions, by consumer, service, resource and action."""
+
+
+def init_app(app):
+    """Configure the caches using the settings of the Flask app."""
+    consumer_cache.configure(
+        app.config['CONSUMER_CACHE_SIZE'],
+        app.config['CONSUMER_CACHE_TTL'])
+    decision_cache.configure(
+        app.config['DECISION_CACHE_SIZE'],
+        app.config['DECISION_CACHE_ALLOW_TTL'],
+        app.config['DECISION_CACHE_DENY_TTL'])
+
+
+def get_consumer(consumer_key):
+    """Return the ConsumerInfo for the specified key or None if not found.
+
+    The consumer cache is checked first and the database is queried only on
+    cache misses. Consumers which are not found are not cached.
+    """
+    consumer = consumer_cache.get(consumer_key)
+    if consumer is None:
+        consumer = store.find_consumer(consumer_key)
+        if consumer is None:
+            return None
+
+        consumer_cache.set(consumer_key, consumer)
+
+    return consumer
+
+
+def get_consumers(consumer_keys):
+    """Return the ConsumerInfo of the specified keys, as a dict by key.
+
+    The consumers missing from the cache are loaded using a single query and
+    cached. The keys of the consumers which are not found are not included.
+    """
+    consumers = {}
+    missing = []
+    for consumer_key in set(consumer_keys):
+        consumer = consumer_cache.get(consumer_key)
+        if consumer is None:
+            missing.append(consumer_key)
+        else:
+            consumers[consumer_key] = consumer
+
+    if missing:
+        for consumer_key, consumer in store.find_consumers(missing).items():
+            consumer_cache.set(consumer_key, consumer)
+            consumers[consumer_key] = consumer
+
+    return consumers
+
+
+def invalidate_consumer(consumer_key):
+    """Drop all the cached data for the specified consumer and bump its
+    revision.
+
+    This must be called every time a consumer is created, changed or removed.
+    """
+    consumer_cache.delete(consumer_key)
+    decision_cache.purge_consumer(consumer_key)
+    signature.hmac_states.invalidate(consumer_key)
+    store.bump_revision(consumer_key)
+
+
+def invalidate_policies(consumer_key):
+    """Drop the cached decisions for the specified consumer and bump its
+    revision.
+
+    This must be called every time a policy of the consumer is created,
+    changed or removed.
+    """
+    decision_cache.purge_consumer(consumer_key)
+    store.bump_revision(consumer_key)
@@ -0,0 +1,2 @@
+from client import AuthzClient
+from remote import RemoteService, ServiceError
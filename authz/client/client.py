@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.client.client
+    ~~~~~~~~~~~~~~~~~~~
+
+    Authz client answering the authorize and authenticate questions locally,
+    using the policies and secrets synced from the REST API.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import time
+import logging
+import threading
+from urlparse import parse_qsl
+from StringIO import StringIO
+
+from authz import signature
+from authz.nonces import MemoryNonceStore
+from authz.matching import RidTrie, POLICY_ACTION_BITS, actions_to_mask
+from remote import RemoteService, ServiceError
+
+
+logger = logging.getLogger(__name__)
+
+
+class AuthzClient(object):
+    """Client for the authz service which evaluates the requests locally.
+
+    The consumers specified by consumer_keys are synced from the REST API,
+    together with their policies, and every decision regarding them is taken
+    in process: authorize decisions use the same wildcard rules as the
+    service and OAuth signatures are verified using the cached secrets.
+
+    The synced data is considered stale after max_age seconds and it is
+    synced again on the next call. If the service cannot be reached, or if
+    the consumer is not one of the synced ones, the call is forwarded to the
+    service instead. Failed syncs are retried after retry_interval seconds.
+
+    Like the service, the client accepts a signed request only once. The
+    nonces are remembered in process, so a request replayed to another
+    client is not detected.
+    """
+
+    def __init__(self, base_url, consumer_keys, max_age=60,
+                 retry_interval=5, http=None, timeout=None):
+        self.remote = RemoteService(base_url, http=http, timeout=timeout)
+        self.consumer_keys = frozenset(consumer_keys)
+        self.max_age = max_age
+        self.retry_interval = retry_interval
+        self._data = None
+        self._synced_at = None
+        self._retry_at = 0
+        self._lock = threading.Lock()
+        self._nonces = MemoryNonceStore()
+
+    def sync(self):
+        """Load the consumers and their policies from the REST API.
+
+        The new data is swapped in at once, so concurrent calls always see a
+        consistent view. A ServiceError is raised if the sync fails.
+        """
+        consumers = {}
+        policies = {}
+        for consumer_key in self.consumer_keys:
+            consumer = self.remote.get_consumer(consumer_key)
+            documents = consumer and self.remote.get_policies(consumer_key)
+            if consumer is None or documents is None:
+                continue
+
+            trie = RidTrie()
+            for document in documents:
+                trie.add(document["rid"], actions_to_mask(document["actions"]))
+            trie.compile()
+
+            consumers[consumer_key] = (
+                consumer.get("name"), consumer["secret"])
+            policies[consumer_key] = trie
+
+        self._data = (consumers, policies)
+        self._synced_at = time.time()
+
+    def _local_data(self):
+        """Return the synced data or None if it is stale and cannot be synced.
+
+        Only one thread syncs the data; the others use the remote service
+        while the sync is in progress.
+        """
+        now = time.time()
+        if self._synced_at is not None and \
+                now - self._synced_at <= self.max_age:
+            return self._data
+
+        if now < self._retry_at or not self._lock.acquire(False):
+            return None
+
+        try:
+            self.sync()
+        except ServiceError, e:
+            logger.warning("Cannot sync the authz policies: %s", e)
+            self._retry_at = now + self.retry_interval
+            return None
+        finally:
+            self._lock.release()
+
+        return self._data
+
+    def authorize(self, consumer_key, service, resource, action):
+        """Check if the consumer can perform the action on the resource.
+
+        The status code of the authorize endpoint is returned: 202 if the
+        action is allowed, 403 if it is not, 401 for unknown consumers and
+        400 for invalid resources.
+        """
+        resource = resource.strip("/")
+        action = action.lower()
+
+        data = self._local_data()
+        if data is None or consumer_key not in self.consumer_keys:
+            return self.remote.authorize(
+                consumer_key, service, resource, action)
+
+        consumers, policies = data
+        if consumer_key not in consumers:
+            return 401
+
+        try:
+            mask = policies[consumer_key].match(service, resource)
+        except ValueError:
+            return 400
+
+        if mask & POLICY_ACTION_BITS.get(action, 0):
+            return 202
+        return 403
+
+    def authenticate(self, method, url, headers=None, body=""):
+        """Verify the OAuth signature of a request.
+
+        The request is described by its method, full URL, headers and body.
+        The (status, consumer) tuple is returned: 202 and a dict with the
+        consumer name and key if the request is authenticated, 401 and None
+        otherwise.
+        """
+        headers = headers or {}
+        form = None
+        if headers.get("Content-Type", "").startswith(
+                signature.FORM_CONTENT_TYPE):
+            form = parse_qsl(body, keep_blank_values=True)
+
+        try:
+            signed_request = signature.SignedRequest(
+                method, url, headers.get("Authorization"), form)
+        except signature.SignatureError:
+            return 401, None
+
+        consumer_key = signed_request.consumer_key
+        if not consumer_key:
+            return 401, None
+
+        data = self._local_data()
+        if data is None or consumer_key not in self.consumer_keys:
+            return self.remote.authenticate(method, url, headers, body)
+
+        if consumer_key not in data[0]:
+            return 401, None
+        name, secret = data[0][consumer_key]
+
+        try:
+            signature.verify(signed_request, secret)
+            signature.verify_body_hash(signed_request, StringIO(body or ""))
+        except signature.SignatureError:
+            return 401, None
+
+        # the nonce is only recorded for properly signed requests
+        nonce = signed_request.oauth_parameters.get('oauth_nonce')
+        if not nonce or not self._nonces.add(
+                consumer_key, nonce,
+                int(signed_request.get('oauth_timestamp'))):
+            return 401, None
+
+        return 202, {"name": name, "key": consumer_key}
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.client.remote
+    ~~~~~~~~~~~~~~~~~~~
+
+    Thin HTTP wrapper around the authz service endpoints and REST API.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import json
+from urllib import quote, quote_plus
+
+import httplib2
+
+
+class ServiceError(Exception):
+    """Raised when the authz service cannot be reached or fails."""
+
+
+class RemoteService(object):
+    """Client for the endpoints of an authz service.
+
+    The base_url is the root URL of the service, for example
+    'http://authz.example.com'. An httplib2.Http instance is created if one
+    is not specified.
+    """
+
+    def __init__(self, base_url, http=None, timeout=None):
+        self.base_url = base_url.rstrip("/")
+        self.http = http or httplib2.Http(timeout=timeout)
+
+    def _request(self, path, method="GET", body=None, headers=None):
+        """Send the request and return the (status, content) tuple.
+
+        A ServiceError is raised if the service cannot be reached or if the
+        response is a server error.
+        """
+        try:
+            response, content = self.http.request(
+                self.base_url + path, method, body=body, headers=headers)
+        except (httplib2.HttpLib2Error, IOError), e:
+            raise ServiceError("Cannot reach %s: %s" % (self.base_url, e))
+
+        if response.status >= 500:
+            raise ServiceError("%s %s failed with %s" % (
+                method, path, response.status))
+
+        return response.status, content
+
+    def _get_json(self, path):
+        """Return the decoded JSON document or None if it doesn't exist."""
+        status, content = self._request(path)
+        if status == 404:
+            return None
+
+        if status != 200:
+            raise ServiceError("GET %s failed with %s" % (path, status))
+
+        try:
+            return json.loads(content)
+        except ValueError:
+            raise ServiceError("GET %s returned invalid JSON" % path)
+
+    def get_consumer(self, consumer_key):
+        """Return the consumer document or None if it doesn't exist."""
+        return self._get_json("/api/1.0/consumers/%s/" % quote(consumer_key))
+
+    def get_policies(self, consumer_key):
+        """Return the list of policy documents of the consumer, following
+        the next links through all the pages.
+
+        None is returned if the consumer doesn't exist.
+        """
+        payload = self._get_json(
+            "/api/1.0/consumers/%s/policies/" % quote(consumer_key))
+        if payload is None:
+            return None
+
+        policies = payload["objects"]
+        while payload.get("next"):
+            payload = self._get_json(payload["next"])
+            if payload is None:
+                raise ServiceError(
+                    "The consumer %s was removed" % consumer_key)
+            policies.extend(payload["objects"])
+
+        return policies
+
+    def authorize(self, consumer_key, service, resource, action):
+        """Call the authorize endpoint and return the response status code."""
+        status, _ = self._request(
+            "/authorize/%s/%s/%s/" % (
+                quote(consumer_key), quote(service), quote(resource)),
+            method=action.upper())
+        return status
+
+    def authenticate(self, method, url, headers=None, body=""):
+        """Call the authenticate endpoint for the signed request.
+
+        The (status, consumer) tuple is returned, where consumer is the
+        document with the consumer name and key if the request is
+        authenticated or None otherwise.
+        """
+        status, content = self._request(
+            "/authenticate/%s" % quote(quote_plus(url)),
+            method=method, body=body, headers=headers)
+        if status != 202:
+            return status, None
+
+        try:
+            return status, json.loads(content)
+        except ValueError:
+            raise ServiceError("The authenticate response is invalid JSON")
@@ -23,3 +23,57 @@ SECRET_KEY = 'X9V.`O#+bQmTmvxsD_`0/>%m|XsC>Lh$t]lMY@rhI$R1P%hY^+m!g,H}oCm=7m@+'
 # MongoAlchemy config
 MONGOALCHEMY_SERVER = 'localhost'
 MONGOALCHEMY_DATABASE = 'authz'
+
+
+# Number of objects returned by default in a page of the REST API lists and
+# the maximum number of objects a client can request using the limit argument
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+
+# Number of policies written by a single query of the bulk policy imports
+POLICY_IMPORT_BATCH_SIZE = 1000
+
+
+# Answer the authorize requests using the in-process policy index instead of
+# querying MongoDB for every request
+POLICY_INDEX_ENABLED = False
+
+
+# Number of seconds after which the policy index is reloaded from MongoDB
+POLICY_INDEX_REFRESH_INTERVAL = 60
+
+
+# Maximum number of consumers kept in the in-process consumer cache; use 0 to
+# disable the cache
+CONSUMER_CACHE_SIZE = 1000
+
+
+# Number of seconds a consumer is kept in the consumer cache
+CONSUMER_CACHE_TTL = 60
+
+
+# Maximum number of decisions kept in the in-process authorize decision cache;
+# use 0 to disable the cache
+DECISION_CACHE_SIZE = 10000
+
+
+# Number of seconds the allowed and the denied decisions are cached for
+DECISION_CACHE_ALLOW_TTL = 30
+DECISION_CACHE_DENY_TTL = 5
+
+
+# Where the recently used OAuth nonces are kept in order to reject the
+# replayed requests: 'memory' for each process, 'mongo' for all the processes
+# using the database, or None to disable the replay protection
+NONCE_STORE = 'memory'
+
+
+# The MongoDB collection used by the 'mongo' nonce store
+NONCE_COLLECTION = 'Nonce'
+
+
+# The 'mongo' nonce store inserts the new nonces in batches, once this many
+# nonces are queued and every this many seconds
+NONCE_BATCH_SIZE = 100
+NONCE_FLUSH_INTERVAL = 1
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.fastpath
+    ~~~~~~~~~~~~~~
+
+    Minimal WSGI application answering the authorize and authenticate
+    requests without going through the Flask dispatching.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import re
+from urllib import unquote_plus
+
+from flask import json
+from werkzeug.wrappers import Request
+from werkzeug.exceptions import HTTP_STATUS_CODES
+
+from authz.api.authorize import authorize
+from authz.api.authenticate import authenticate
+
+
+AUTHORIZE_PATH = re.compile(
+    r'^/authorize/([^/]+)/([^/]+)/([^/].*?)(?<!/)/$', re.UNICODE)
+"""The authorize route, matching the same paths as the Flask URL rule."""
+
+
+AUTHENTICATE_PATH = re.compile(r'^/authenticate/([^/].*?)$', re.UNICODE)
+"""The authenticate route, matching the same paths as the Flask URL rule."""
+
+
+METHODS = frozenset(["GET", "POST", "PUT", "DELETE"])
+"""The request methods handled by the service endpoints."""
+
+
+def _status(code):
+    """Return the WSGI status line for the status code."""
+    return "%d %s" % (code, HTTP_STATUS_CODES[code].upper())
+
+
+RESPONSES = dict(
+    (code, (_status(code), [
+        ("Content-Type", "text/plain"),
+        ("Content-Length", "0")]))
+    for code in (202, 400, 401, 403))
+"""The prebuilt status-only responses, by status code."""
+
+
+class FastPathApp(object):
+    """WSGI application answering the service requests directly.
+
+    The authorize and authenticate requests are parsed from the path and
+    answered using the same functions as the Flask views, so the decisions
+    are the same. Only the error pages are replaced by empty responses. Any
+    other request, including the batch authorize requests and the requests
+    the Flask URL rules would redirect or reject, is passed to the wrapped
+    Flask app.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        method = environ.get("REQUEST_METHOD")
+        if method in METHODS:
+            try:
+                path = environ.get("PATH_INFO", "").decode("utf-8")
+            except UnicodeError:
+                path = None
+
+            if path and path.startswith("/authorize/"):
+                match = AUTHORIZE_PATH.match(path)
+                if match:
+                    consumer_key, service, resource = match.groups()
+                    code = authorize(
+                        consumer_key, service, resource, method.lower())
+                    start_response(*RESPONSES[code])
+                    return [""]
+
+            elif path and path.startswith("/authenticate/"):
+                match = AUTHENTICATE_PATH.match(path)
+                if match:
+                    return self._authenticate(
+                        match.group(1), environ, start_response)
+
+        return self.app(environ, start_response)
+
+    def _authenticate(self, url, environ, start_response):
+        """Answer the authenticate request for the specified URL."""
+        code, consumer = authenticate(unquote_plus(url), Request(environ))
+        if code != 202:
+            start_response(*RESPONSES[code])
+            return [""]
+
+        body = json.dumps({"name": consumer.name, "key": consumer.key})
+        start_response(_status(202), [
+            ("Content-Type", "application/json"),
+            ("Content-Length", str(len(body)))])
+        return [body]
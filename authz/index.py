@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.index
+    ~~~~~~~~~~~
+
+    In-process policy index used to answer authorize requests without any
+    database round trips.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import time
+import threading
+
+from authz import store
+from authz.matching import RidTrie, POLICY_ACTION_BITS, split_resource
+
+
+class PolicyIndex(object):
+    """In-memory index of all the consumers and policies in the system.
+
+    The index is loaded from MongoDB the first time it is used and it is
+    reloaded once the refresh interval elapses, so changes made to consumers
+    and policies are visible after at most POLICY_INDEX_REFRESH_INTERVAL
+    seconds.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.refresh_interval = 60
+        self._lock = threading.Lock()
+        self._reset()
+
+    def init_app(self, app):
+        """Configure the index using the settings of the Flask app."""
+        self.enabled = app.config['POLICY_INDEX_ENABLED']
+        self.refresh_interval = app.config['POLICY_INDEX_REFRESH_INTERVAL']
+        self._reset()
+
+    def _reset(self):
+        """Drop all the loaded data."""
+        self._data = ({}, {})
+        self._loaded_at = None
+
+    def refresh(self):
+        """Reload all the consumers and policies from the database.
+
+        The new data is compiled aside and swapped in at once, so concurrent
+        lookups always see a consistent index.
+        """
+        consumers = {}
+        for consumer in store.iter_consumers():
+            consumers[consumer.key] = consumer
+
+        policies = {}
+        for consumer_key, rid, mask in store.iter_policies():
+            trie = policies.get(consumer_key)
+            if trie is None:
+                trie = policies[consumer_key] = RidTrie()
+            trie.add(rid, mask)
+
+        for trie in policies.itervalues():
+            trie.compile()
+
+        self._data = (consumers, policies)
+        self._loaded_at = time.time()
+
+    def _ensure_fresh(self):
+        """Load the index if it is missing or older than the refresh interval.
+
+        Only one thread reloads the index; the others keep using the
+        previously loaded data while the reload is in progress.
+        """
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    self.refresh()
+        elif time.time() - self._loaded_at > self.refresh_interval:
+            if self._lock.acquire(False):
+                try:
+                    self.refresh()
+                finally:
+                    self._lock.release()
+
+        return self._data
+
+    def get_consumer(self, consumer_key):
+        """Return the ConsumerInfo for the specified key or None."""
+        consumers, policies = self._ensure_fresh()
+        return consumers.get(consumer_key)
+
+    def is_allowed(self, consumer_key, service, resource, action):
+        """Check if the consumer can perform the action on the resource.
+
+        A ValueError is raised if the resource is not valid.
+        """
+        consumers, policies = self._ensure_fresh()
+        trie = policies.get(consumer_key)
+        if trie is None:
+            # still reject the invalid resources, like the policy query does
+            split_resource(resource)
+            return False
+
+        mask = trie.match(service, resource)
+        return bool(mask & POLICY_ACTION_BITS.get(action, 0))
+
+
+policy_index = PolicyIndex()
+"""The policy index shared by the application."""
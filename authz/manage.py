@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.manage
+    ~~~~~~~~~~~~
+
+    Define the management commands for the authz database.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import sys
+import argparse
+
+from pymongo.errors import OperationFailure
+
+from authz import store, snapshot, bulk
+from authz.application import create, mongo
+from authz.models import User, Consumer, Policy
+from authz.matching import POLICY_ACTION_MASKS, actions_to_mask, rid_filters
+
+
+OBSOLETE_POLICY_INDEXES = ('consumer_key_1_rid_1_actions_1',)
+"""Indexes replaced by the actions_mask based authorize index."""
+
+
+MIGRATION_BATCH_SIZE = 1000
+"""The maximum number of policies updated by a single migration query."""
+
+
+def _create_app():
+    """Create an application instance used only for accessing the database."""
+    return create(
+        load_admin=False, load_rest_api=False, load_service_api=False)
+
+
+def check_indexes():
+    """Verify that all the indexes declared by the models exist.
+
+    The query plan of the authorize query is also checked and any collection
+    scan is reported. Use --ensure to create the missing indexes. The exit
+    code is 1 if any problem was found.
+    """
+    parser = argparse.ArgumentParser(description=check_indexes.__doc__)
+    parser.add_argument(
+        '--ensure', action='store_true',
+        help='create the missing indexes')
+    args = parser.parse_args()
+
+    _create_app()
+    db = mongo.session.db
+    problems = 0
+
+    for model in (User, Consumer, Policy):
+        collection = db[model.get_collection_name()]
+        existing = [
+            info['key'] for info in collection.index_information().values()]
+
+        for index in model.get_indexes():
+            if index.components in existing:
+                continue
+
+            if args.ensure:
+                try:
+                    index.ensure(collection)
+                except OperationFailure, e:
+                    print "ERROR: cannot create index %s on %s: %s" % (
+                        index.components, model.__name__, e)
+                    problems += 1
+                else:
+                    print "Created index %s on %s" % (
+                        index.components, model.__name__)
+            else:
+                print "ERROR: missing index %s on %s" % (
+                    index.components, model.__name__)
+                problems += 1
+
+    plan = _explain_authorize_query(db)
+    if plan['cursor'].startswith('BasicCursor'):
+        print "ERROR: the authorize query does a collection scan " \
+              "(nscanned=%s)" % plan.get('nscanned')
+        problems += 1
+    else:
+        print "Authorize query uses %s (nscanned=%s)" % (
+            plan['cursor'], plan.get('nscanned'))
+
+    if problems:
+        return 1
+
+    print "All the indexes are in place"
+
+
+def _explain_authorize_query(db):
+    """Return the query plan for a typical authorize query."""
+    collection = db[Policy.get_collection_name()]
+
+    sample = collection.find_one() or {
+        "consumer_key": "",
+        "rid": "rid:explain:resource/resource-id"}
+    service, _, resource = sample["rid"][4:].rpartition(":")
+
+    try:
+        rids = list(rid_filters(service, resource))
+    except ValueError:
+        rids = [sample["rid"]]
+
+    query = {
+        "consumer_key": sample["consumer_key"],
+        "rid": {"$in": rids},
+        "actions_mask": {"$in": POLICY_ACTION_MASKS["get"]}
+    }
+    return collection.find(query).limit(1).explain()
+
+
+def migrate_actions():
+    """Store the actions bitmask on the policies which are missing it.
+
+    The authorize queries match the policies on the actions_mask field, so
+    this must be run once on the databases created before the field was
+    introduced. The obsolete authorize index is dropped and the new one is
+    created. Use --all to recompute the bitmask of every policy.
+    """
+    parser = argparse.ArgumentParser(description=migrate_actions.__doc__)
+    parser.add_argument(
+        '--all', action='store_true',
+        help='recompute the bitmask of all the policies')
+    args = parser.parse_args()
+
+    _create_app()
+    collection = mongo.session.db[Policy.get_collection_name()]
+
+    spec = {}
+    if not args.all:
+        spec = {"actions_mask": {"$exists": False}}
+
+    # group the policies by mask, so they are updated with a few queries
+    ids_by_mask = {}
+    for document in collection.find(spec, fields={"actions": True}):
+        mask = actions_to_mask(document.get("actions", ()))
+        ids_by_mask.setdefault(mask, []).append(document["_id"])
+
+    migrated = 0
+    for mask, ids in ids_by_mask.iteritems():
+        for start in xrange(0, len(ids), MIGRATION_BATCH_SIZE):
+            batch = ids[start:start + MIGRATION_BATCH_SIZE]
+            collection.update(
+                {"_id": {"$in": batch}},
+                {"$set": {"actions_mask": mask}},
+                multi=True, safe=True)
+            migrated += len(batch)
+
+    print "Updated the actions bitmask of %d policies" % migrated
+
+    existing = collection.index_information()
+    for name in OBSOLETE_POLICY_INDEXES:
+        if name in existing:
+            collection.drop_index(name)
+            print "Dropped the obsolete index %s" % name
+
+    for index in Policy.get_indexes():
+        index.ensure(collection)
+
+
+def export_snapshot():
+    """Export all the consumers and policies to a policy snapshot file.
+
+    The snapshot can be memory mapped by the processes running on the same
+    host, using authz.snapshot.PolicySnapshot, to authorize requests without
+    calling the service. An existing snapshot is replaced atomically.
+    """
+    parser = argparse.ArgumentParser(description=export_snapshot.__doc__)
+    parser.add_argument('path', help='the path of the snapshot file')
+    args = parser.parse_args()
+
+    _create_app()
+    consumer_keys = [consumer.key for consumer in store.iter_consumers()]
+    snapshot.export_snapshot(args.path, consumer_keys, store.iter_policies())
+
+    print "Exported %d consumers to %s" % (len(consumer_keys), args.path)
+
+
+def import_policies():
+    """Import the policies from an NDJSON file, one policy per line.
+
+    The policies are written in batches and the lines which cannot be
+    imported are reported without stopping the import. The exit code is 1 if
+    any line was not imported.
+    """
+    parser = argparse.ArgumentParser(description=import_policies.__doc__)
+    parser.add_argument(
+        'path', help='the path of the NDJSON file, or - for stdin')
+    parser.add_argument(
+        '--upsert', action='store_true',
+        help='replace the actions of the existing policies')
+    parser.add_argument(
+        '--batch-size', type=int,
+        help='the number of policies written by a single query')
+    args = parser.parse_args()
+
+    app = _create_app()
+    batch_size = args.batch_size or app.config['POLICY_IMPORT_BATCH_SIZE']
+
+    source = sys.stdin if args.path == '-' else open(args.path)
+    try:
+        report = bulk.import_policies(
+            source, upsert=args.upsert, batch_size=batch_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    for error in report["errors"]:
+        print "ERROR: line %d: %s" % (error["line"], error["error"])
+
+    print "Created %d and updated %d policies" % (
+        report["created"], report["updated"])
+    if report["errors"]:
+        return 1
+
+
+def export_policies():
+    """Export all the policies to an NDJSON file, one policy per line."""
+    parser = argparse.ArgumentParser(description=export_policies.__doc__)
+    parser.add_argument(
+        'path', help='the path of the NDJSON file, or - for stdout')
+    args = parser.parse_args()
+
+    _create_app()
+    target = sys.stdout if args.path == '-' else open(args.path, 'w')
+    try:
+        target.writelines(bulk.export_policies())
+    finally:
+        if target is not sys.stdout:
+            target.close()
+
+
+if __name__ == '__main__':
+    sys.exit(check_indexes())
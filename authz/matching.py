@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.matching
+    ~~~~~~~~~~~~~~
+
+    Define the policy matching rules shared by the authorize endpoints and the
+    in-process policy index.
+
+    A policy rid is made of the 'rid:<service>:' prefix followed by the
+    resource path, where the trailing segments may be replaced with wildcards:
+      * '*' matches exactly one segment
+      * '**' matches any number of segments, including none
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+POLICY_ACTION_CHOICES = ("get", "post", "put", "delete")
+"""The allowed values for the Policy.action field."""
+
+
+POLICY_ACTION_BITS = dict(
+    (action, 1 << i) for i, action in enumerate(POLICY_ACTION_CHOICES))
+"""The bit assigned to each of the allowed policy actions."""
+
+
+POLICY_ACTION_MASKS = dict(
+    (action, tuple(
+        mask for mask in xrange(1 << len(POLICY_ACTION_CHOICES))
+        if mask & bit))
+    for action, bit in POLICY_ACTION_BITS.iteritems())
+"""All the action masks including each of the allowed policy actions.
+
+MongoDB has no bitwise query operators, so the policies allowing an action
+are matched with an $in filter over these masks.
+"""
+
+
+WILDCARD = "*"
+"""Resource segment matching exactly one segment."""
+
+
+RECURSIVE_WILDCARD = "**"
+"""Resource segment matching any number of segments."""
+
+
+def actions_to_mask(actions):
+    """Return the bitmask for the specified list of policy actions.
+
+    Actions which are not part of POLICY_ACTION_CHOICES are ignored.
+    """
+    mask = 0
+    for action in actions:
+        mask |= POLICY_ACTION_BITS.get(action, 0)
+
+    return mask
+
+
+def mask_to_actions(mask):
+    """Return the list of policy actions included in the bitmask."""
+    return [
+        action for action in POLICY_ACTION_CHOICES
+        if mask & POLICY_ACTION_BITS[action]]
+
+
+def split_resource(resource):
+    """Split the resource path into segments.
+
+    A ValueError is raised if the resource contains empty segments.
+    """
+    resource_parts = resource.split("/")
+    if not all(resource_parts):
+        raise ValueError()
+
+    return resource_parts
+
+
+def rid_filters(service, resource):
+    """Return the rids of the policies which could give access to a resource.
+
+    For every prefix of the resource path, the prefix followed by one '*' for
+    each remaining segment and the prefix followed by '**' are considered, so
+    the number of filters grows only with the depth of the resource.
+    :: For example 'stations/42' is matched by:
+        rid:<service>:**
+        rid:<service>:*/*
+        rid:<service>:stations/**
+        rid:<service>:stations/*
+        rid:<service>:stations/42/**
+        rid:<service>:stations/42
+    """
+    resource_parts = split_resource(resource)
+    prefix = "rid:%s:" % service
+
+    filters = set([prefix + "/".join(resource_parts)])
+    for depth in xrange(len(resource_parts)):
+        head = resource_parts[:depth]
+        filters.add(prefix + "/".join(head + [RECURSIVE_WILDCARD]))
+        filters.add(prefix + "/".join(
+            head + [WILDCARD] * (len(resource_parts) - depth)))
+
+    filters.add(prefix + "/".join(resource_parts + [RECURSIVE_WILDCARD]))
+    return tuple(filters)
+
+
+class _Node(object):
+    """A single segment of the compiled rid patterns."""
+
+    __slots__ = ('children', 'mask', 'star_masks')
+
+    def __init__(self):
+        self.children = {}
+        self.mask = 0
+        self.star_masks = None
+
+
+class RidTrie(object):
+    """Rid patterns compiled into a segment trie.
+
+    The rids are split on '/' and every segment becomes a level in the trie.
+    The first segment keeps the 'rid:<service>:' prefix, so the patterns are
+    grouped by service at the top level of the trie. Each node holds the
+    bitmask of the actions allowed by the pattern ending on that node.
+
+    The masks of the '*' chains are precomputed for each node, so a lookup
+    visits a constant number of nodes for each segment of the resource,
+    regardless of the number of patterns in the trie.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self._compiled = True
+
+    def add(self, rid, mask):
+        """Add the rid pattern and the bitmask of the allowed actions."""
+        node = self.root
+        for segment in rid.split("/"):
+            node = node.children.get(segment) or node.children.setdefault(
+                segment, _Node())
+
+        node.mask |= mask
+        self._compiled = False
+
+    def compile(self):
+        """Precompute the masks of the '*' chains starting from every node.
+
+        This is called automatically on the first lookup after a change.
+        """
+        stack = [(self.root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                stack.append((node, True))
+                for child in node.children.itervalues():
+                    stack.append((child, False))
+                continue
+
+            star_masks = [node.mask]
+            star = node.children.get(WILDCARD)
+            if star is not None:
+                star_masks.extend(star.star_masks)
+            node.star_masks = star_masks
+
+        self._compiled = True
+
+    def match(self, service, resource):
+        """Return the bitmask of the actions allowed on the resource.
+
+        The result is the same as checking all the rid_filters of the resource
+        against the patterns in the trie. A ValueError is raised if the
+        resource is not valid.
+        """
+        if not self._compiled:
+            self.compile()
+
+        resource_parts = split_resource(resource)
+        depth = len(resource_parts)
+        children = self.root.children
+
+        # The first segment carries the service prefix, so the wildcards
+        # matching it are looked up separately.
+        mask = self._star_mask(
+            children.get("rid:%s:%s" % (service, WILDCARD)), depth - 1)
+        node = children.get("rid:%s:%s" % (service, RECURSIVE_WILDCARD))
+        if node is not None:
+            mask |= node.mask
+
+        node = children.get("rid:%s:%s" % (service, resource_parts[0]))
+        for index in xrange(1, depth):
+            if node is None:
+                return mask
+
+            children = node.children
+            mask |= self._star_mask(
+                children.get(WILDCARD), depth - index - 1)
+            if RECURSIVE_WILDCARD in children:
+                mask |= children[RECURSIVE_WILDCARD].mask
+
+            node = children.get(resource_parts[index])
+
+        if node is not None:
+            mask |= node.mask
+            if RECURSIVE_WILDCARD in node.children:
+                mask |= node.children[RECURSIVE_WILDCARD].mask
+
+        return mask
+
+    def _star_mask(self, node, length):
+        """Return the mask of the '*' chain starting with the specified node.
+        """
+        if node is None or length >= len(node.star_masks):
+            return 0
+
+        return node.star_masks[length]
@@ -10,14 +10,20 @@
 """
 import string
 import random
+from collections import namedtuple
 
 from mongoalchemy.document import Index
 
 from application import mongo
+from matching import POLICY_ACTION_CHOICES, actions_to_mask
 
 
-POLICY_ACTION_CHOICES = ("get", "post", "put", "delete")
-"""The allowed values for the Policy.action field."""
+ConsumerInfo = namedtuple('ConsumerInfo', ('key', 'name', 'secret'))
+"""Lightweight, read-only representation of a consumer used on hot paths."""
+
+
+PolicyInfo = namedtuple('PolicyInfo', ('consumer_key', 'rid', 'actions'))
+"""Lightweight, read-only representation of a policy."""
 
 
 def generate_key(length, extra_chars=None):
@@ -118,6 +124,25 @@ class Policy(mongo.Document):
         mongo.EnumField(mongo.StringField(), *POLICY_ACTION_CHOICES))
     """:: the list of allowed actions."""
 
+    actions_mask = mongo.IntField(min_value=0, required=False)
+    """:: bitmask of the allowed actions, kept in sync with the actions."""
+
+    iconsumer_rid = Index().ascending('consumer_key').ascending('rid').unique()
+    """:: unique index for the consumer key and resource identifier."""
+
+    iauthorize = Index().ascending('consumer_key').ascending('rid').ascending(
+        'actions_mask')
+    """:: index covering all the fields used by the authorize query."""
+
+    iaccess = Index().ascending('rid').ascending('actions_mask').ascending(
+        'consumer_key')
+    """:: index covering the query for the consumers allowed on a resource."""
+
     def __repr__(self):
         """Return the object representation used by the admin tool."""
         return "%s:%s" % (self.consumer_key, self.rid)
+
+    def wrap(self):
+        """Update the actions bitmask before the policy is saved."""
+        self.actions_mask = actions_to_mask(getattr(self, 'actions', ()))
+        return super(Policy, self).wrap()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.nonces
+    ~~~~~~~~~~~~
+
+    Replay protection for the OAuth signed requests.
+
+    A signed request is accepted only once: its (consumer key, nonce,
+    timestamp) combination is remembered for as long as the timestamp is
+    accepted by the signature verification, so the stores never grow beyond
+    the requests received during that window.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from authz.signature import TIMESTAMP_THRESHOLD
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryNonceStore(object):
+    """In-process store of the recently used nonces.
+
+    The nonces are grouped in buckets by their timestamp. A whole bucket is
+    dropped once all its timestamps are outside the accepted window, so the
+    eviction never looks at individual nonces.
+    """
+
+    def __init__(self, window=TIMESTAMP_THRESHOLD, bucket_size=60):
+        self.window = window
+        self.bucket_size = bucket_size
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def add(self, consumer_key, nonce, timestamp, now=None):
+        """Remember the nonce of a signed request.
+
+        False is returned if the nonce was already used by the consumer with
+        the same timestamp, meaning the request is a replay.
+        """
+        if now is None:
+            now = time.time()
+
+        key = (consumer_key, nonce, timestamp)
+        with self._lock:
+            self._evict(now)
+            bucket = self._buckets.setdefault(
+                timestamp // self.bucket_size, set())
+            if key in bucket:
+                return False
+
+            bucket.add(key)
+            return True
+
+    def _evict(self, now):
+        """Drop the buckets whose timestamps are all out of the window."""
+        for index in self._buckets.keys():
+            if (index + 1) * self.bucket_size + self.window < now:
+                del self._buckets[index]
+
+    def clear(self):
+        """Forget all the nonces."""
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.itervalues())
+
+
+class MongoNonceStore(MemoryNonceStore):
+    """Nonce store shared by all the processes using the same database.
+
+    The replays are detected using the in-process store first and then by
+    looking the nonce up in a MongoDB collection. The new nonces are not
+    written on every request: they are queued and inserted in batches, once
+    batch_size nonces are queued and every flush_interval seconds by a
+    background thread, which also flushes them when the process exits.
+    A replay sent to a different process before its nonce is flushed is not
+    detected.
+
+    The expired documents are removed while flushing, at most once every
+    prune_interval seconds, so the collection stays bounded on MongoDB 2.0.
+    On MongoDB 2.2 and later they are expired by a TTL index as well.
+    """
+
+    def __init__(self, collection, window=TIMESTAMP_THRESHOLD, bucket_size=60,
+                 batch_size=100, flush_interval=1, prune_interval=60):
+        super(MongoNonceStore, self).__init__(window, bucket_size)
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.prune_interval = prune_interval
+        self._pending = []
+        self._pruned_at = 0
+        self._indexed = False
+        self._flusher = None
+        self._stopped = False
+
+    def add(self, consumer_key, nonce, timestamp, now=None):
+        """Remember the nonce of a signed request.
+
+        False is returned if the nonce was already used by the consumer with
+        the same timestamp, meaning the request is a replay.
+        """
+        if now is None:
+            now = time.time()
+
+        if not super(MongoNonceStore, self).add(
+                consumer_key, nonce, timestamp, now):
+            return False
+
+        document = {
+            "consumer_key": consumer_key,
+            "nonce": nonce,
+            "timestamp": timestamp
+        }
+        if self.collection().find_one(document, fields={"_id": True}):
+            return False
+
+        document["expires"] = datetime.utcfromtimestamp(
+            timestamp + self.window)
+        with self._lock:
+            self._pending.append(document)
+            if self._flusher is None:
+                self._start_flusher()
+            full = len(self._pending) >= self.batch_size
+
+        if full:
+            self.flush(now)
+        return True
+
+    def flush(self, now=None):
+        """Insert all the queued nonces and remove the expired ones, if they
+        were not removed during the last prune_interval seconds.
+        """
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+            prune = now - self._pruned_at >= self.prune_interval
+            if prune:
+                self._pruned_at = now
+
+        if pending:
+            self._insert(pending)
+
+        if prune:
+            self.collection().remove(
+                {"expires": {"$lt": datetime.utcfromtimestamp(now)}})
+
+    def _start_flusher(self):
+        """Start the thread flushing the queued nonces every flush_interval
+        seconds and flush them when the process exits. The lock must be held.
+
+        The thread is started by the first add, so each worker process gets
+        its own, and it is a greenlet if gevent patched the threading module.
+        """
+        self._flusher = threading.Thread(target=self._flush_periodically)
+        self._flusher.daemon = True
+        self._flusher.start()
+        atexit.register(self._stop_flusher)
+
+    def _stop_flusher(self):
+        """Stop the flushing thread and flush the queued nonces."""
+        self._stopped = True
+        self._flush_safely()
+
+    def _flush_periodically(self):
+        """Flush the queued nonces every flush_interval seconds."""
+        while True:
+            time.sleep(self.flush_interval)
+            # the module globals may be gone once the interpreter exits
+            if self._stopped:
+                return
+
+            self._flush_safely()
+
+    def _flush_safely(self):
+        """Flush the queued nonces, logging the errors instead of raising."""
+        try:
+            self.flush()
+        except Exception, e:
+            logger.warning("Cannot flush the nonces: %s", e)
+
+    def _insert(self, documents):
+        """Insert the nonces, ignoring the ones already inserted."""
+        collection = self.collection()
+        if not self._indexed:
+            collection.ensure_index(
+                [("consumer_key", 1), ("nonce", 1), ("timestamp", 1)],
+                unique=True)
+            collection.ensure_index("expires", expireAfterSeconds=0)
+            self._indexed = True
+
+        collection.insert(documents, continue_on_error=True)
+
+
+class NonceChecker(object):
+    """Replay protection configured using the settings of the Flask app.
+
+    Until it is configured, or if NONCE_STORE is empty, all the nonces are
+    accepted.
+    """
+
+    def __init__(self):
+        self.store = None
+
+    def init_app(self, app):
+        """Configure the nonce store using the settings of the Flask app."""
+        kind = app.config['NONCE_STORE']
+        if kind == 'memory':
+            self.store = MemoryNonceStore()
+        elif kind == 'mongo':
+            from authz.application import mongo
+            self.store = MongoNonceStore(
+                lambda: mongo.session.db[app.config['NONCE_COLLECTION']],
+                batch_size=app.config['NONCE_BATCH_SIZE'],
+                flush_interval=app.config['NONCE_FLUSH_INTERVAL'])
+        elif kind:
+            raise ValueError("Unknown nonce store: %s" % kind)
+        else:
+            self.store = None
+
+    def add(self, consumer_key, nonce, timestamp):
+        """Remember the nonce, returning False if the request is a replay.
+
+        Requests without a nonce are rejected once the store is configured.
+        """
+        if self.store is None:
+            return True
+
+        if not nonce:
+            return False
+
+        return self.store.add(consumer_key, nonce, timestamp)
+
+
+nonce_checker = NonceChecker()
+"""The replay protection shared by the application."""
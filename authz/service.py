@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.service
+    ~~~~~~~~~~~~~
+
+    Standalone server for the authorize and authenticate endpoints, able to
+    keep many concurrent checks in flight in a single process.
+
+    By default the connections are handled by a fixed pool of threads, so a
+    request waiting on MongoDB only blocks its own thread. If gevent is
+    installed the server can also run on greenlets, which allows thousands of
+    concurrent requests.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import argparse
+import threading
+from Queue import Queue
+
+from werkzeug.serving import BaseWSGIServer
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    """WSGI server handing the accepted connections to a pool of threads.
+
+    The accept loop blocks when all the threads are busy and the queue of
+    pending connections is full, leaving the new connections in the listen
+    backlog.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads=32, **kwargs):
+        BaseWSGIServer.__init__(self, host, port, app, **kwargs)
+        self.threads = threads
+        self._pending = Queue(threads)
+        for i in xrange(threads):
+            worker = threading.Thread(target=self._process_requests)
+            worker.daemon = True
+            worker.start()
+
+    def process_request(self, request, client_address):
+        """Queue the connection to be handled by the pool."""
+        self._pending.put((request, client_address))
+
+    def _process_requests(self):
+        """Handle the queued connections, forever."""
+        while True:
+            request, client_address = self._pending.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
+def _serve_threads(app, host, port, concurrency):
+    """Serve the app using a pool of threads."""
+    server = ThreadPoolWSGIServer(host, port, app, threads=concurrency)
+    server.serve_forever()
+
+
+def _serve_gevent(app, host, port, concurrency):
+    """Serve the app using a pool of greenlets."""
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+
+    server = WSGIServer((host, port), app, spawn=Pool(concurrency))
+    server.serve_forever()
+
+
+def runservice():
+    """Run the authorize and authenticate endpoints.
+
+    The admin tool and the REST API are not loaded. Use --gevent to run the
+    requests on greenlets instead of threads; gevent must be installed.
+    """
+    parser = argparse.ArgumentParser(description=runservice.__doc__)
+    parser.add_argument(
+        '--host', default='0.0.0.0',
+        help='the address to listen on')
+    parser.add_argument(
+        '--port', type=int, default=5000,
+        help='the port to listen on')
+    parser.add_argument(
+        '--concurrency', type=int,
+        help='the maximum number of requests handled at once '
+             '(default: 32 threads or 1000 greenlets)')
+    parser.add_argument(
+        '--gevent', action='store_true',
+        help='handle the requests using gevent')
+    args = parser.parse_args()
+
+    if args.gevent:
+        # the sockets and thread locals must be patched before the MongoDB
+        # connection is created
+        from gevent import monkey
+        monkey.patch_all()
+        serve, concurrency = _serve_gevent, 1000
+    else:
+        serve, concurrency = _serve_threads, 32
+
+    from authz.application import create_fast_path
+    app = create_fast_path(load_admin=False, load_rest_api=False)
+
+    serve(app, args.host, args.port, args.concurrency or concurrency)
+
+
+if __name__ == '__main__':
+    runservice()
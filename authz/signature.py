@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.signature
+    ~~~~~~~~~~~~~~~
+
+    Verify the signatures of 2-legged OAuth 1.0 requests, signed using the
+    HMAC-SHA1 or HMAC-SHA256 methods.
+
+    The signature base string is built directly from the target URL, the
+    Authorization header and the already parsed form body, as described in
+    RFC 5849, section 3.4.1. The request body is never copied: non-form
+    bodies are only read, in chunks, to check the oauth_body_hash parameter
+    of the OAuth Request Body Hash extension.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import hmac
+import time
+import hashlib
+import binascii
+from urllib import quote, unquote
+from urlparse import urlsplit, parse_qsl
+
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+"""The content type of the request bodies included in the signature."""
+
+
+TIMESTAMP_THRESHOLD = 300
+"""The maximum difference in seconds between the request timestamp and now."""
+
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+"""The ports excluded from the base string URI."""
+
+
+BODY_CHUNK_SIZE = 64 * 1024
+"""The number of bytes read at once when hashing a request body."""
+
+
+class SignatureError(Exception):
+    """Raised when the request is not properly signed."""
+
+
+def _to_utf8(value):
+    """Return the UTF-8 encoded value, if it is an unicode string."""
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
+
+
+def escape(value):
+    """Percent encode the value as required by RFC 5849, section 3.6."""
+    return quote(_to_utf8(value), safe="~")
+
+
+def parse_authorization_header(header):
+    """Return the list of the OAuth parameters in the Authorization header.
+
+    An empty list is returned if the header doesn't use the OAuth scheme. The
+    realm parameter is not included.
+    """
+    if not header or header[:6].lower() != "oauth ":
+        return []
+
+    parameters = []
+    for item in header[6:].split(","):
+        name, separator, value = item.strip().partition("=")
+        if not separator:
+            raise SignatureError("Invalid Authorization header")
+
+        name = unquote(name.strip())
+        if name != "realm":
+            parameters.append((name, unquote(value.strip().strip('"'))))
+
+    return parameters
+
+
+class SignedRequest(object):
+    """The signature related parts of a request.
+
+    The request parameters are collected from the query string of the URL,
+    the form body, if any, and the Authorization header. The form is a
+    mapping from the request body, already parsed by the caller; werkzeug
+    MultiDicts are supported. It is None if the body is not form encoded.
+    """
+
+    def __init__(self, method, url, authorization=None, form=None):
+        self.method = method.upper()
+
+        scheme, netloc, path, query, _ = urlsplit(_to_utf8(url))
+        scheme = scheme.lower()
+        host, _, port = netloc.lower().partition(":")
+        if port and port != DEFAULT_PORTS.get(scheme):
+            host = "%s:%s" % (host, port)
+        self.base_uri = "%s://%s%s" % (scheme, host, path or "/")
+
+        self.parameters = parse_qsl(query, keep_blank_values=True)
+        self.form_encoded = form is not None
+        if form:
+            if hasattr(form, "iteritems"):
+                self.parameters.extend(form.iteritems(multi=True))
+            else:
+                self.parameters.extend(form)
+        self.parameters.extend(parse_authorization_header(authorization))
+
+        self.oauth_parameters = dict(
+            (name, value) for name, value in self.parameters
+            if name.startswith("oauth_"))
+
+    def get(self, name):
+        """Return the value of the OAuth parameter.
+
+        A SignatureError is raised if the parameter is missing.
+        """
+        value = self.oauth_parameters.get(name)
+        if value is None:
+            raise SignatureError("Missing OAuth parameter: %s" % name)
+        return value
+
+    @property
+    def consumer_key(self):
+        """The key of the consumer which signed the request, if any."""
+        return self.oauth_parameters.get("oauth_consumer_key")
+
+    def base_string(self):
+        """Return the signature base string of the request."""
+        parameters = sorted(
+            (escape(name), escape(value))
+            for name, value in self.parameters
+            if name != "oauth_signature")
+        normalized = "&".join("%s=%s" % item for item in parameters)
+
+        return "&".join((
+            escape(self.method), escape(self.base_uri), escape(normalized)))
+
+
+SIGNATURE_METHODS = {
+    "HMAC-SHA1": hashlib.sha1,
+    "HMAC-SHA256": hashlib.sha256
+}
+"""The supported signature methods and their digest functions."""
+
+
+class HMACStates(object):
+    """Cache of the keyed HMAC objects of the consumers.
+
+    Keying an HMAC object hashes the padded key, so the keyed objects are
+    created once for every consumer and signature method and then copied for
+    every request. An object is replaced automatically if the secret of its
+    consumer changes. All the objects are dropped when the cache is full.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._states = {}
+
+    def get(self, consumer_key, consumer_secret, digestmod):
+        """Return a fresh copy of the keyed HMAC object of the consumer."""
+        entry = self._states.get((consumer_key, digestmod))
+        if entry is None or entry[0] != consumer_secret:
+            if len(self._states) >= self.maxsize:
+                self._states.clear()
+
+            key = "%s&" % escape(consumer_secret)
+            entry = (consumer_secret, hmac.new(key, digestmod=digestmod))
+            self._states[(consumer_key, digestmod)] = entry
+
+        return entry[1].copy()
+
+    def invalidate(self, consumer_key):
+        """Drop the HMAC objects of the consumer."""
+        for digestmod in SIGNATURE_METHODS.itervalues():
+            self._states.pop((consumer_key, digestmod), None)
+
+    def clear(self):
+        """Drop all the HMAC objects."""
+        self._states.clear()
+
+
+hmac_states = HMACStates()
+"""The HMAC objects shared by all the signature verifications."""
+
+
+def sign(request, consumer_secret, method="HMAC-SHA1"):
+    """Return the signature of the request using the signature method."""
+    state = hmac_states.get(
+        request.consumer_key, consumer_secret, SIGNATURE_METHODS[method])
+    state.update(request.base_string())
+    return binascii.b2a_base64(state.digest())[:-1]
+
+
+def _equals(expected, actual):
+    """Compare the strings in constant time."""
+    if len(expected) != len(actual):
+        return False
+
+    result = 0
+    for x, y in zip(expected, actual):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def verify(request, consumer_secret, now=None):
+    """Verify the signature of the 2-legged OAuth request.
+
+    A SignatureError is raised if the version, timestamp or signature of the
+    request are not valid.
+    """
+    version = request.oauth_parameters.get("oauth_version", "1.0")
+    if version != "1.0":
+        raise SignatureError("OAuth version %s not supported" % version)
+
+    method = request.get("oauth_signature_method")
+    if method not in SIGNATURE_METHODS:
+        raise SignatureError("Signature method %s not supported" % method)
+
+    try:
+        timestamp = int(request.get("oauth_timestamp"))
+    except ValueError:
+        raise SignatureError("Invalid timestamp")
+
+    if now is None:
+        now = time.time()
+    if abs(now - timestamp) > TIMESTAMP_THRESHOLD:
+        raise SignatureError("Expired timestamp")
+
+    signature = request.get("oauth_signature")
+    expected = sign(request, consumer_secret, method)
+    if not _equals(expected, _to_utf8(signature)):
+        raise SignatureError("Invalid signature")
+
+
+def body_hash(stream, method="HMAC-SHA1", chunk_size=BODY_CHUNK_SIZE):
+    """Return the oauth_body_hash of the body read from the stream.
+
+    The body is hashed in chunks, using the digest function of the signature
+    method, so it is never held in memory as a whole.
+    """
+    state = SIGNATURE_METHODS[method]()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        state.update(chunk)
+    return binascii.b2a_base64(state.digest())[:-1]
+
+
+def verify_body_hash(request, stream):
+    """Verify the oauth_body_hash of the request against its body.
+
+    Requests without a body hash are accepted, since the extension is
+    optional. The hash is not checked for form encoded bodies either, since
+    their parameters are already part of the signature. A SignatureError is
+    raised if the hash doesn't match the body read from the stream. The
+    signature of the request is expected to be verified already.
+    """
+    expected = request.oauth_parameters.get("oauth_body_hash")
+    if expected is None or request.form_encoded:
+        return
+
+    actual = body_hash(stream, request.get("oauth_signature_method"))
+    if not _equals(actual, _to_utf8(expected)):
+        raise SignatureError("Invalid body hash")
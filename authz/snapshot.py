@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.snapshot
+    ~~~~~~~~~~~~~~
+
+    Compact binary snapshot of the consumers and policies, meant to be shared
+    by many processes on the same host through a read-only memory map.
+
+    The snapshot file is laid out as follows, all integers being little endian
+    unsigned 32 bit values:
+      * the header: magic, string count, consumer count, policy count
+      * the string offsets table: string count + 1 offsets into the string
+        data, relative to its start
+      * the consumers table: (key string, first policy, policy count) records,
+        sorted by key
+      * the policies table: (rid string, actions mask) records, grouped by
+        consumer and sorted by rid within each group
+      * the string data: the UTF-8 encoded strings
+
+    All the strings are interned and sorted, so the string ids have the same
+    order as the strings themselves and the tables can be searched by id.
+    Only the consumer keys are exported, never the secrets.
+
+    This module doesn't depend on Flask or MongoDB, so it can be used by the
+    API workers without the rest of the application.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+import os
+import mmap
+import struct
+
+from authz.matching import POLICY_ACTION_BITS, rid_filters
+
+
+SNAPSHOT_MAGIC = "AUTHZSN1"
+"""The magic string identifying the snapshot files and their format version."""
+
+
+HEADER = struct.Struct("<8sIII")
+"""The snapshot header: magic, string, consumer and policy counts."""
+
+
+OFFSET = struct.Struct("<I")
+"""An entry of the string offsets table."""
+
+
+CONSUMER = struct.Struct("<III")
+"""A consumers table record: key string id, first policy, policy count."""
+
+
+POLICY = struct.Struct("<II")
+"""A policies table record: rid string id and actions mask."""
+
+
+def write_snapshot(fileobj, consumer_keys, policies):
+    """Write the snapshot of the consumers and policies to the file object.
+
+    The consumer_keys is an iterable with the keys of all the consumers and
+    policies is an iterable of (consumer_key, rid, mask) tuples. Policies for
+    unknown consumers are skipped.
+    """
+    rules = dict((key, {}) for key in consumer_keys)
+    for consumer_key, rid, mask in policies:
+        if consumer_key in rules:
+            consumer_rules = rules[consumer_key]
+            consumer_rules[rid] = consumer_rules.get(rid, 0) | mask
+
+    strings = set(rules)
+    for consumer_rules in rules.itervalues():
+        strings.update(consumer_rules)
+
+    strings = sorted(string.encode("utf-8") for string in strings)
+    ids = dict((string.decode("utf-8"), i) for i, string in enumerate(strings))
+
+    consumers_table = []
+    policies_table = []
+    for consumer_key in sorted(rules, key=ids.get):
+        consumer_rules = rules[consumer_key]
+        consumers_table.append(CONSUMER.pack(
+            ids[consumer_key], len(policies_table), len(consumer_rules)))
+        for rid in sorted(consumer_rules, key=ids.get):
+            policies_table.append(POLICY.pack(ids[rid], consumer_rules[rid]))
+
+    offsets = [0]
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+
+    fileobj.write(HEADER.pack(
+        SNAPSHOT_MAGIC, len(strings), len(consumers_table),
+        len(policies_table)))
+    fileobj.write("".join(OFFSET.pack(offset) for offset in offsets))
+    fileobj.write("".join(consumers_table))
+    fileobj.write("".join(policies_table))
+    fileobj.write("".join(strings))
+
+
+def export_snapshot(path, consumer_keys, policies):
+    """Write the snapshot to the specified path.
+
+    The snapshot is written to a temporary file which then replaces the
+    existing one, so the processes still mapping the old snapshot are not
+    affected.
+    """
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as fileobj:
+            write_snapshot(fileobj, consumer_keys, policies)
+        os.rename(tmp_path, path)
+    finally:
+        # the temporary file is left only if the snapshot was not written
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class PolicySnapshot(object):
+    """Read-only view of a snapshot file.
+
+    The file is memory mapped, so all the processes opening the same snapshot
+    share the same pages and the lookups only touch the few pages they need.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fileobj:
+            self._stat = os.fstat(fileobj.fileno())
+            self._map = mmap.mmap(
+                fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._map) < HEADER.size or \
+                self._map[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError("Not a policy snapshot: %s" % path)
+
+        _, self.string_count, self.consumer_count, self.policy_count = \
+            HEADER.unpack_from(self._map, 0)
+
+        self._offsets_start = HEADER.size
+        self._consumers_start = (
+            self._offsets_start + (self.string_count + 1) * OFFSET.size)
+        self._policies_start = (
+            self._consumers_start + self.consumer_count * CONSUMER.size)
+        self._strings_start = (
+            self._policies_start + self.policy_count * POLICY.size)
+
+    def close(self):
+        """Unmap the snapshot file."""
+        self._map.close()
+
+    def is_stale(self):
+        """Check if the snapshot file was replaced since it was opened."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+
+        return (stat.st_ino, stat.st_mtime) != (
+            self._stat.st_ino, self._stat.st_mtime)
+
+    def _string(self, string_id):
+        """Return the encoded string with the specified id."""
+        start, end = struct.unpack_from(
+            "<II", self._map, self._offsets_start + string_id * OFFSET.size)
+        return self._map[self._strings_start + start:
+                         self._strings_start + end]
+
+    def _string_id(self, string):
+        """Return the id of the string or None if it is not interned."""
+        string = string.encode("utf-8")
+        low, high = 0, self.string_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._string(middle) < string:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.string_count and self._string(low) == string:
+            return low
+        return None
+
+    def _find(self, record, table_start, low, high, value):
+        """Return the position of the record starting with the value or None.
+
+        The records between low and high must be sorted by their first field.
+        """
+        while low < high:
+            middle = (low + high) // 2
+            current = struct.unpack_from(
+                "<I", self._map, table_start + middle * record.size)[0]
+            if current < value:
+                low = middle + 1
+            elif current > value:
+                high = middle
+            else:
+                return middle
+
+        return None
+
+    def _consumer(self, consumer_key):
+        """Return the policy range of the consumer or None if not found."""
+        key_id = self._string_id(consumer_key)
+        if key_id is None:
+            return None
+
+        position = self._find(
+            CONSUMER, self._consumers_start, 0, self.consumer_count, key_id)
+        if position is None:
+            return None
+
+        _, first, count = CONSUMER.unpack_from(
+            self._map, self._consumers_start + position * CONSUMER.size)
+        return first, first + count
+
+    def has_consumer(self, consumer_key):
+        """Check if the consumer exists."""
+        return self._consumer(consumer_key) is not None
+
+    def get_mask(self, consumer_key, service, resource):
+        """Return the bitmask of the actions allowed on the resource.
+
+        A ValueError is raised if the resource is not valid.
+        """
+        rids = rid_filters(service, resource)
+        policies = self._consumer(consumer_key)
+        if policies is None:
+            return 0
+
+        mask = 0
+        for rid in rids:
+            rid_id = self._string_id(rid)
+            if rid_id is None:
+                continue
+
+            position = self._find(
+                POLICY, self._policies_start, policies[0], policies[1],
+                rid_id)
+            if position is not None:
+                mask |= POLICY.unpack_from(
+                    self._map, self._policies_start +
+                    position * POLICY.size)[1]
+
+        return mask
+
+    def is_allowed(self, consumer_key, service, resource, action):
+        """Check if the consumer can perform the action on the resource.
+
+        A ValueError is raised if the resource is not valid.
+        """
+        mask = self.get_mask(consumer_key, service, resource)
+        return bool(mask & POLICY_ACTION_BITS.get(action, 0))
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+    authz.store
+    ~~~~~~~~~~~
+
+    Lean data access layer used on the hot paths of the service endpoints.
+
+    The functions defined here issue raw pymongo queries with field projections
+    and return plain tuples, bypassing the MongoAlchemy document mapping. The
+    REST API and the admin tool keep using the models, which also take care of
+    creating the indexes these queries rely on.
+
+    :copyright: (c) 2012 by Ion Scerbatiuc
+    :license: BSD
+"""
+from itertools import groupby
+from operator import itemgetter
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from authz.application import mongo
+from authz.models import Consumer, Policy, ConsumerInfo, PolicyInfo
+from authz.matching import (
+    POLICY_ACTION_CHOICES, POLICY_ACTION_MASKS, actions_to_mask)
+
+
+CONSUMER_FIELDS = {"_id": False, "key": True, "name": True, "secret": True}
+"""Projection used for loading ConsumerInfo tuples."""
+
+
+REVISIONS_COLLECTION = "ConsumerRevision"
+"""The collection of the consumer revision counters, keyed by consumer key."""
+
+
+def _collection(model):
+    """Return the pymongo collection used by the specified model."""
+    return mongo.session.db[model.get_collection_name()]
+
+
+def find_consumer(consumer_key):
+    """Return the ConsumerInfo for the specified key or None if not found."""
+    document = _collection(Consumer).find_one(
+        {"key": consumer_key}, fields=CONSUMER_FIELDS)
+    if document is None:
+        return None
+
+    return ConsumerInfo(
+        document["key"], document.get("name"), document["secret"])
+
+
+def update_consumer(consumer_key, changes):
+    """Set the specified fields of the consumer using a single query.
+
+    The updated ConsumerInfo is returned, or None if the consumer is not
+    found.
+    """
+    document = _collection(Consumer).find_and_modify(
+        {"key": consumer_key}, {"$set": changes},
+        new=True, fields=CONSUMER_FIELDS)
+    if not document:
+        return None
+
+    return ConsumerInfo(
+        document["key"], document.get("name"), document["secret"])
+
+
+def find_consumers(consumer_keys):
+    """Return the ConsumerInfo of the specified keys using a single query.
+
+    The result is a dict mapping the keys of the existing consumers to their
+    ConsumerInfo.
+    """
+    documents = _collection(Consumer).find(
+        {"key": {"$in": list(consumer_keys)}}, fields=CONSUMER_FIELDS)
+
+    return dict([
+        (document["key"], ConsumerInfo(
+            document["key"], document.get("name"), document["secret"]))
+        for document in documents])
+
+
+def iter_consumers():
+    """Iterate through all the consumers, as ConsumerInfo tuples."""
+    for document in _collection(Consumer).find(fields=CONSUMER_FIELDS):
+        yield ConsumerInfo(
+            document["key"], document.get("name"), document["secret"])
+
+
+def has_policy(consumer_key, rids, action):
+    """Check if the consumer has a policy allowing the action on any of the
+    specified rids.
+
+    The query is covered by the Policy.iauthorize index.
+    """
+    masks = POLICY_ACTION_MASKS.get(action)
+    if not masks:
+        return False
+
+    document = _collection(Policy).find_one({
+        "consumer_key": consumer_key,
+        "rid": {"$in": rids},
+        "actions_mask": {"$in": masks}
+    }, fields={"_id": False, "rid": True})
+    return document is not None
+
+
+def find_access(rids, action, limit, after=None):
+    """Iterate through the first consumers having a policy which allows the
+    action on any of the specified rids.
+
+    The consumers are (consumer_key, rids) tuples sorted by key, where rids
+    are the rids of the matching policies, starting after the specified
+    consumer key, if any. The first limit consumers are complete; the ones
+    after them, if any, may miss some of their rids. The query is covered by
+    the Policy.iaccess index.
+    """
+    masks = POLICY_ACTION_MASKS.get(action)
+    if not masks:
+        return
+
+    rids = list(rids)
+    spec = {"rid": {"$in": rids}, "actions_mask": {"$in": masks}}
+    if after is not None:
+        spec["consumer_key"] = {"$gt": after}
+
+    # the index cannot provide the sort, but a consumer has at most one
+    # policy per rid, so the limit keeps the in-memory sort bounded
+    documents = _collection(Policy).find(
+        spec, fields={"_id": False, "consumer_key": True, "rid": True}
+    ).sort("consumer_key", ASCENDING).limit(limit * len(rids))
+
+    for consumer_key, group in groupby(documents, itemgetter("consumer_key")):
+        yield consumer_key, sorted(document["rid"] for document in group)
+
+
+def find_policy_masks(consumer_key, rids):
+    """Return the action masks of the consumer policies for the specified rids.
+
+    The result is a dict mapping the rids of the existing policies to the
+    bitmasks of the allowed actions.
+    """
+    documents = _collection(Policy).find(
+        {"consumer_key": consumer_key, "rid": {"$in": rids}},
+        fields={"_id": False, "rid": True, "actions_mask": True})
+
+    return dict([
+        (document["rid"], document.get("actions_mask", 0))
+        for document in documents])
+
+
+def find_policy_ids(consumer_keys, rids):
+    """Return the ids of the existing policies of the consumers for the rids.
+
+    The result is a dict mapping (consumer_key, rid) tuples to the policy
+    ids. The query is covered by the Policy.iconsumer_rid index.
+    """
+    documents = _collection(Policy).find(
+        {"consumer_key": {"$in": list(consumer_keys)},
+         "rid": {"$in": list(rids)}},
+        fields={"_id": True, "consumer_key": True, "rid": True})
+
+    return dict([
+        ((document["consumer_key"], document["rid"]), document["_id"])
+        for document in documents])
+
+
+def insert_policies(documents):
+    """Insert the policy documents using a single query.
+
+    The documents must hold the consumer_key, rid, actions and actions_mask
+    fields. The list of the documents which were not inserted because the
+    policy already exists is returned.
+    """
+    collection = _collection(Policy)
+    for index in Policy.get_indexes():
+        index.ensure(collection)
+
+    try:
+        collection.insert(documents, safe=True, continue_on_error=True)
+    except DuplicateKeyError:
+        # the ids of the policies which were inserted are the ones assigned
+        # to the documents
+        stored = find_policy_ids(
+            set(document["consumer_key"] for document in documents),
+            set(document["rid"] for document in documents))
+        return [
+            document for document in documents
+            if stored.get((document["consumer_key"], document["rid"])) !=
+            document["_id"]]
+
+    return []
+
+
+def set_policy_actions(policy_ids, actions):
+    """Replace the actions of the specified policies using a single query.
+    """
+    _collection(Policy).update(
+        {"_id": {"$in": list(policy_ids)}},
+        {"$set": {
+            "actions": list(actions),
+            "actions_mask": actions_to_mask(actions)}},
+        multi=True, safe=True)
+
+
+def update_policy(consumer_key, rid, actions=None, add_actions=None,
+                  remove_actions=None):
+    """Change the actions of the policy using a single query.
+
+    The actions are either replaced, extended with add_actions or reduced by
+    remove_actions, and the actions bitmask is changed in the same update.
+    The updated PolicyInfo is returned, or None if the policy is not found.
+    """
+    if actions is not None:
+        update = {"$set": {
+            "actions": sorted(set(actions)),
+            "actions_mask": actions_to_mask(actions)}}
+    elif add_actions is not None:
+        update = {
+            "$addToSet": {"actions": {"$each": list(add_actions)}},
+            "$bit": {"actions_mask": {"or": actions_to_mask(add_actions)}}}
+    else:
+        all_actions = actions_to_mask(POLICY_ACTION_CHOICES)
+        update = {
+            "$pullAll": {"actions": list(remove_actions)},
+            "$bit": {"actions_mask": {
+                "and": all_actions & ~actions_to_mask(remove_actions)}}}
+
+    document = _collection(Policy).find_and_modify(
+        {"consumer_key": consumer_key, "rid": rid}, update, new=True,
+        fields={"_id": False, "consumer_key": True, "rid": True,
+                "actions": True})
+    if not document:
+        return None
+
+    return PolicyInfo(
+        document["consumer_key"], document["rid"], document["actions"])
+
+
+def iter_policies():
+    """Iterate through all the policies as (consumer_key, rid, mask) tuples.
+    """
+    documents = _collection(Policy).find(
+        fields={"_id": False, "consumer_key": True, "rid": True,
+                "actions_mask": True})
+
+    for document in documents:
+        yield (document["consumer_key"], document["rid"],
+               document.get("actions_mask", 0))
+
+
+def get_revision(consumer_key):
+    """Return the revision of the consumer and its policies.
+
+    The revision is 0 for the consumers which were never changed.
+    """
+    document = mongo.session.db[REVISIONS_COLLECTION].find_one(
+        {"_id": consumer_key}, fields={"_id": False, "revision": True})
+    if document is None:
+        return 0
+
+    return document["revision"]
+
+
+def bump_revision(consumer_key):
+    """Increment the revision of the consumer and its policies.
+
+    The counter is kept apart from the consumer document, so that saving a
+    consumer never overwrites it.
+    """
+    mongo.session.db[REVISIONS_COLLECTION].update(
+        {"_id": consumer_key}, {"$inc": {"revision": 1}}, upsert=True)
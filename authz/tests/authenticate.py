@@ -1,14 +1,16 @@
 import time
 import oauth2 as oauth
-from urllib import quote_plus
+from urllib import quote_plus, unquote_plus
 
 from flask import url_for, json
+from werkzeug.test import Client
 
 from authz.models import Consumer
+from authz.fastpath import FastPathApp
 from base import AuthzTestCase
 from fixtures import TEST_CONSUMERS
 
-__all__ = ('AuthenticateTestCase',)
+__all__ = ('AuthenticateTestCase', 'FastPathAuthenticateTestCase')
 
 
 def _build_request(consumer, method, url, body=''):
@@ -155,3 +157,93 @@ class AuthenticateTestCase(AuthzTestCase):
 
         rv = self.client.get(url)
         self.assertEquals(401, rv.status_code)
+
+    def test_invalid_body_hash(self):
+        consumer = oauth.Consumer(key="XYZ", secret="ZYX")
+        payload = json.dumps({"title": "Test Station", "tvcode": "TSTA"})
+        request_url = _build_request(
+            consumer,
+            "POST",
+            "http://api.pbs.org/1.0/stations/?format=json",
+            body=payload)
+
+        with self.app.test_request_context():
+            url = url_for('authenticate_endpoints.index', url=request_url)
+
+        rv = self.client.post(
+            url, data=payload.replace("TSTA", "TSTB"),
+            content_type="application/json")
+        self.assertEquals(401, rv.status_code)
+
+    def test_replayed(self):
+        consumer = oauth.Consumer(key="ABC", secret="CBA")
+        request_url = _build_request(
+            consumer,
+            "GET",
+            "http://api.pbs.org/1.0/stations/?format=json")
+
+        with self.app.test_request_context():
+            url = url_for('authenticate_endpoints.index', url=request_url)
+
+        rv = self.client.get(url)
+        self.assertEquals(202, rv.status_code)
+
+        rv = self.client.get(url)
+        self.assertEquals(401, rv.status_code)
+
+    def test_batch(self):
+        xyz = oauth.Consumer(key="XYZ", secret="ZYX")
+        url = "http://api.pbs.org/1.0/stations/?format=json"
+        payload = json.dumps({"title": "Test Station", "tvcode": "TSTA"})
+        entries = [
+            {"method": "GET",
+             "url": unquote_plus(_build_request(xyz, "GET", url))},
+            {"method": "POST",
+             "url": unquote_plus(
+                 _build_request(xyz, "POST", url, body=payload)),
+             "headers": {"Content-Type": "application/json"},
+             "body": payload},
+            {"method": "PUT",
+             "url": unquote_plus(_build_request(
+                 oauth.Consumer(key="ABC", secret="wrong"), "PUT", url))},
+            {"method": "GET",
+             "url": unquote_plus(_build_request(
+                 oauth.Consumer(key="MISSING", secret="ABC"), "GET", url))},
+            {"method": "GET", "url": url},
+        ]
+        # the last request is a replay of the first one
+        entries.append(entries[0])
+
+        with self.app.test_request_context():
+            batch_url = url_for('authenticate_endpoints.batch')
+
+        rv = self.client.post(
+            batch_url, data=json.dumps(entries),
+            content_type="application/json")
+        self.assertEquals(200, rv.status_code)
+
+        objects = json.loads(rv.data)["objects"]
+        self.assertEquals(
+            [202, 202, 401, 401, 401, 401],
+            [obj["status"] for obj in objects])
+        self.assertEquals("XYZ", objects[0]["key"])
+        self.assertEquals("Consumer XYZ", objects[1]["name"])
+
+    def test_batch_invalid_payload(self):
+        with self.app.test_request_context():
+            batch_url = url_for('authenticate_endpoints.batch')
+
+        for payload in ('invalid', '{}', '[1]', '[{"method": "GET"}]',
+                        '[{"method": "GET", "url": "http://a/", '
+                        '"headers": {"Authorization": 1}}]'):
+            rv = self.client.post(
+                batch_url, data=payload, content_type="application/json")
+            self.assertEquals(400, rv.status_code)
+
+
+class FastPathAuthenticateTestCase(AuthenticateTestCase):
+    """Run the authenticate tests against the WSGI fast path."""
+
+    def setUp(self):
+        super(FastPathAuthenticateTestCase, self).setUp()
+        self.client = Client(FastPathApp(self.app), self.app.response_class)
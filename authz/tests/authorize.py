@@ -1,10 +1,14 @@
-from flask import url_for
+from flask import url_for, json
+from werkzeug.test import Client
 
 from authz.models import Consumer, Policy
+from authz.fastpath import FastPathApp
 from base import AuthzTestCase
 from fixtures import TEST_CONSUMERS, TEST_POLICIES
 
-__all__ = ('AuthorizeTestCase',)
+__all__ = (
+    'AuthorizeTestCase', 'IndexedAuthorizeTestCase',
+    'FastPathAuthorizeTestCase')
 
 
 class AuthorizeTestCase(AuthzTestCase):
@@ -65,19 +69,81 @@ class AuthorizeTestCase(AuthzTestCase):
                 'authorize_endpoints.index',
                 consumer_key="ABC",
                 service="pbs:api",
-                resource="program")
+                resource="program//test-program")
 
         rv = self.client.get(url)
-        self.assertEquals(500, rv.status_code)
+        self.assertEquals(400, rv.status_code)
 
         rv = self.client.post(url)
-        self.assertEquals(500, rv.status_code)
+        self.assertEquals(400, rv.status_code)
+
+        rv = self.client.put(url)
+        self.assertEquals(400, rv.status_code)
+
+        rv = self.client.delete(url)
+        self.assertEquals(400, rv.status_code)
+
+    def test_single_segment_resource(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'authorize_endpoints.index',
+                consumer_key="XYZ",
+                service="pbs:api",
+                resource="program")
+
+        rv = self.client.get(url)
+        self.assertEquals(403, rv.status_code)
+
+        with self.app.test_request_context():
+            url = url_for(
+                'authorize_endpoints.index',
+                consumer_key="DEF",
+                service="pbs:api",
+                resource="program")
+
+        rv = self.client.get(url)
+        self.assertEquals(202, rv.status_code)
+
+    def test_authorize_deep_resource(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'authorize_endpoints.index',
+                consumer_key="DEF",
+                service="pbs:api",
+                resource="station/42/schedule/7")
+
+        rv = self.client.get(url)
+        self.assertEquals(202, rv.status_code)
 
         rv = self.client.put(url)
-        self.assertEquals(500, rv.status_code)
+        self.assertEquals(202, rv.status_code)
 
         rv = self.client.delete(url)
-        self.assertEquals(500, rv.status_code)
+        self.assertEquals(403, rv.status_code)
+
+        with self.app.test_request_context():
+            url = url_for(
+                'authorize_endpoints.index',
+                consumer_key="DEF",
+                service="pbs:api",
+                resource="station/42/schedule/7/entries")
+
+        rv = self.client.get(url)
+        self.assertEquals(403, rv.status_code)
+
+    def test_authorize_recursive_wildcard(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'authorize_endpoints.index',
+                consumer_key="DEF",
+                service="pbs:api",
+                resource="program/nova/episode/42")
+
+        rv = self.client.get(url)
+        self.assertEquals(202, rv.status_code)
+
+        rv = self.client.put(url)
+        self.assertEquals(403, rv.status_code)
 
     def test_authorize_wildcard_resource(self):
         with self.app.test_request_context():
@@ -138,3 +204,72 @@ class AuthorizeTestCase(AuthzTestCase):
 
         rv = self.client.delete(url)
         self.assertEquals(403, rv.status_code)
+
+    def test_batch_unauthorized(self):
+        with self.app.test_request_context():
+            url = url_for('authorize_endpoints.batch', consumer_key="TUV")
+
+        payload = json.dumps([
+            {"service": "pbs:api", "resource": "station/utmedia",
+             "action": "get"}
+        ])
+        rv = self.client.post(
+            url, data=payload,
+            content_type="application/json")
+        self.assertEquals(401, rv.status_code)
+
+    def test_batch_invalid_payload(self):
+        with self.app.test_request_context():
+            url = url_for('authorize_endpoints.batch', consumer_key="XYZ")
+
+        rv = self.client.post(url, data='{}', content_type="application/json")
+        self.assertEquals(400, rv.status_code)
+
+        rv = self.client.post(
+            url, data='[{"service": "pbs:api"}]',
+            content_type="application/json")
+        self.assertEquals(400, rv.status_code)
+        self.assertContains(rv, "Missing required fields: resource, action")
+
+    def test_batch(self):
+        with self.app.test_request_context():
+            url = url_for('authorize_endpoints.batch', consumer_key="XYZ")
+
+        checks = [
+            ("program/test-program", "put", 202),
+            ("program/test-program", "delete", 403),
+            ("station/utmedia", "delete", 202),
+            ("topic/science-technology", "get", 202),
+            ("topic/science-technology", "post", 403),
+            ("program", "get", 403),
+            ("program//test-program", "get", 400),
+        ]
+        payload = json.dumps([
+            {"service": "pbs:api", "resource": resource, "action": action}
+            for resource, action, status in checks
+        ])
+        rv = self.client.post(
+            url, data=payload,
+            content_type="application/json")
+        self.assertEquals(200, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals(len(checks), len(response["objects"]))
+        for (resource, action, status), obj in zip(
+                checks, response["objects"]):
+            self.assertEquals(resource, obj["resource"])
+            self.assertEquals(action, obj["action"])
+            self.assertEquals(status, obj["status"])
+
+
+class IndexedAuthorizeTestCase(AuthorizeTestCase):
+    """Run the authorize tests against the in-process policy index."""
+    POLICY_INDEX_ENABLED = True
+
+
+class FastPathAuthorizeTestCase(AuthorizeTestCase):
+    """Run the authorize tests against the WSGI fast path."""
+
+    def setUp(self):
+        super(FastPathAuthorizeTestCase, self).setUp()
+        self.client = Client(FastPathApp(self.app), self.app.response_class)
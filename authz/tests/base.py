@@ -2,6 +2,7 @@ import unittest
 
 from authz.application import mongo, create
 from authz.models import Consumer, Policy
+from authz.store import REVISIONS_COLLECTION
 
 
 class AuthzTestCase(unittest.TestCase):
@@ -17,6 +18,7 @@ class AuthzTestCase(unittest.TestCase):
         """Destroy the mongo db database."""
         with self.app.test_request_context():
             mongo.session.clear_collection(Consumer, Policy)
+            mongo.session.db[REVISIONS_COLLECTION].drop()
 
     def assertContains(self, response, text):
         """Validate if a specific text is found in the request."""
@@ -0,0 +1,157 @@
+from flask import url_for, json
+
+from authz.application import mongo
+from authz.models import Consumer, Policy
+from authz.cache import decision_cache
+from base import AuthzTestCase
+from fixtures import TEST_CONSUMERS, TEST_POLICIES
+
+__all__ = ('BulkPoliciesTestCase',)
+
+
+def _ndjson(*policies):
+    """Return the NDJSON payload for the policies."""
+    return "".join(json.dumps(policy) + "\n" for policy in policies)
+
+
+class BulkPoliciesTestCase(AuthzTestCase):
+    POLICY_IMPORT_BATCH_SIZE = 2
+
+    def setUp(self):
+        super(BulkPoliciesTestCase, self).setUp()
+
+        # Create test data
+        with self.app.test_request_context():
+            for consumer in TEST_CONSUMERS:
+                Consumer(**consumer).save()
+
+            for policy in TEST_POLICIES:
+                Policy(**policy).save()
+
+            self.import_url = url_for('rest_endpoints.import_policies')
+            self.export_url = url_for('rest_endpoints.export_policies')
+
+    def _import(self, payload, url=None):
+        """Post the NDJSON payload and return the import report."""
+        rv = self.client.post(
+            url or self.import_url, data=payload,
+            content_type="application/x-ndjson")
+        self.assertEquals(200, rv.status_code)
+        return json.loads(rv.data)
+
+    def test_import(self):
+        payload = _ndjson(
+            {"consumer_key": "ABC", "rid": "rid:pbs:api:program/*",
+             "actions": ["get", "put"]},
+            {"consumer_key": "ABC", "rid": "rid:pbs:api:station/*",
+             "actions": ["get", "put"]},
+            {"consumer_key": "MISSING", "rid": "rid:pbs:api:program/*",
+             "actions": ["get"]},
+            {"consumer_key": "DEF", "rid": "rid:pbs:api:station/*",
+             "actions": ["delete"]},
+            {"consumer_key": "DEF", "actions": ["get"]},
+            {"consumer_key": "DEF", "rid": "rid:pbs:api:*",
+             "actions": ["fly"]})
+        payload += "\ninvalid\n"
+        payload += _ndjson(
+            {"consumer_key": "DEF", "rid": "rid:pbs:api:" + "x" * 200,
+             "actions": ["get"]})
+
+        report = self._import(payload)
+        self.assertEquals(2, report["created"])
+        self.assertEquals(0, report["updated"])
+        self.assertEquals(
+            [2, 3, 5, 6, 8, 9],
+            [error["line"] for error in report["errors"]])
+
+        with self.app.test_request_context():
+            policy = Policy.query.filter(
+                Policy.consumer_key == "ABC",
+                Policy.rid == "rid:pbs:api:program/*").one()
+            self.assertEquals(set(["get", "put"]), policy.actions)
+            self.assertEquals(5, policy.actions_mask)
+
+            # the existing policy is unchanged
+            policy = Policy.query.filter(
+                Policy.consumer_key == "ABC",
+                Policy.rid == "rid:pbs:api:station/*").one()
+            self.assertEquals(set(["get"]), policy.actions)
+
+    def test_import_upsert(self):
+        with self.app.test_request_context():
+            url = url_for('authorize_endpoints.index',
+                          consumer_key="ABC",
+                          service="pbs:api",
+                          resource="station/utmedia")
+
+        rv = self.client.put(url)
+        self.assertEquals(403, rv.status_code)
+
+        payload = _ndjson(
+            {"consumer_key": "ABC", "rid": "rid:pbs:api:station/*",
+             "actions": ["get", "put"]},
+            {"consumer_key": "ABC", "rid": "rid:pbs:api:program/*",
+             "actions": ["get"]},
+            {"consumer_key": "ABC", "rid": "rid:pbs:api:program/*",
+             "actions": ["post"]})
+
+        # the last policy is in a different batch than the one creating it
+        report = self._import(payload, self.import_url + "?upsert=1")
+        self.assertEquals(1, report["created"])
+        self.assertEquals(2, report["updated"])
+        self.assertEquals([], report["errors"])
+
+        # the cached decisions of the consumer are dropped
+        rv = self.client.put(url)
+        self.assertEquals(202, rv.status_code)
+
+        with self.app.test_request_context():
+            policy = Policy.query.filter(
+                Policy.consumer_key == "ABC",
+                Policy.rid == "rid:pbs:api:program/*").one()
+            self.assertEquals(set(["post"]), policy.actions)
+
+    def test_import_upsert_same_policy(self):
+        payload = _ndjson(
+            {"consumer_key": "ABC", "rid": "rid:pbs:api:station/*",
+             "actions": ["put"]},
+            {"consumer_key": "ABC", "rid": "rid:pbs:api:station/*",
+             "actions": ["get", "delete"]})
+
+        # both lines are in the same batch and the last one wins
+        report = self._import(payload, self.import_url + "?upsert=1")
+        self.assertEquals(0, report["created"])
+        self.assertEquals(1, report["updated"])
+        self.assertEquals([], report["errors"])
+
+        with self.app.test_request_context():
+            policy = Policy.query.filter(
+                Policy.consumer_key == "ABC",
+                Policy.rid == "rid:pbs:api:station/*").one()
+            self.assertEquals(set(["get", "delete"]), policy.actions)
+
+    def test_import_invalid_content_type(self):
+        rv = self.client.post(
+            self.import_url, data="{}", content_type="application/json")
+        self.assertEquals(415, rv.status_code)
+
+    def test_export(self):
+        rv = self.client.get(self.export_url)
+        self.assertEquals(200, rv.status_code)
+        self.assertEquals("application/x-ndjson", rv.mimetype)
+
+        policies = [json.loads(line) for line in rv.data.splitlines()]
+        self.assertEquals(
+            sorted((policy["consumer_key"], policy["rid"],
+                    sorted(policy["actions"])) for policy in TEST_POLICIES),
+            sorted((policy["consumer_key"], policy["rid"],
+                    sorted(policy["actions"])) for policy in policies))
+
+        # the export can be imported back
+        with self.app.test_request_context():
+            decision_cache.clear()
+            mongo.session.clear_collection(Policy)
+
+        report = self._import(rv.data)
+        self.assertEquals(len(TEST_POLICIES), report["created"])
+        self.assertEquals([], report["errors"])
@@ -0,0 +1,86 @@
+import unittest
+
+from authz.cache import TTLCache, DecisionCache
+
+__all__ = ('TTLCacheTestCase', 'DecisionCacheTestCase')
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_get_set(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        self.assertEquals(None, cache.get("ABC"))
+        cache.set("ABC", 1)
+        self.assertEquals(1, cache.get("ABC"))
+        self.assertEquals(1, cache.hits)
+        self.assertEquals(1, cache.misses)
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("ABC", 1)
+        cache.set("DEF", 2)
+        cache.get("ABC")
+        cache.set("XYZ", 3)
+
+        self.assertEquals(1, cache.get("ABC"))
+        self.assertEquals(None, cache.get("DEF"))
+        self.assertEquals(3, cache.get("XYZ"))
+        self.assertEquals(2, cache.stats()["size"])
+
+    def test_expiration(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("ABC", 1, ttl=-1)
+        cache.set("DEF", 2)
+        self.assertEquals(None, cache.get("ABC"))
+        self.assertEquals(2, cache.get("DEF"))
+
+    def test_delete(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("ABC", 1)
+        cache.delete("ABC")
+        cache.delete("DEF")
+        self.assertEquals(None, cache.get("ABC"))
+
+    def test_disabled(self):
+        cache = TTLCache(maxsize=0, ttl=60)
+        cache.set("ABC", 1)
+        self.assertEquals(None, cache.get("ABC"))
+
+
+class DecisionCacheTestCase(unittest.TestCase):
+    def test_ttls(self):
+        cache = DecisionCache(maxsize=10, allow_ttl=60, deny_ttl=0)
+        cache.set_decision(("XYZ", "pbs:api", "station/x", "get"), True)
+        cache.set_decision(("XYZ", "pbs:api", "station/x", "post"), False)
+
+        self.assertEquals(
+            True,
+            cache.get(("XYZ", "pbs:api", "station/x", "get")))
+        self.assertEquals(
+            None,
+            cache.get(("XYZ", "pbs:api", "station/x", "post")))
+
+    def test_purge_consumer(self):
+        cache = DecisionCache(maxsize=10, allow_ttl=60, deny_ttl=60)
+        cache.set_decision(("XYZ", "pbs:api", "station/x", "get"), True)
+        cache.set_decision(("XYZ", "pbs:api", "station/x", "post"), False)
+        cache.set_decision(("ABC", "pbs:api", "station/x", "get"), True)
+
+        cache.purge_consumer("XYZ")
+        self.assertEquals(1, cache.stats()["size"])
+        self.assertEquals(
+            True,
+            cache.get(("ABC", "pbs:api", "station/x", "get")))
+
+    def test_purge_during_query(self):
+        cache = DecisionCache(maxsize=10, allow_ttl=60, deny_ttl=60)
+        key = ("XYZ", "pbs:api", "station/x", "get")
+
+        # the policies are changed while the decision is being computed
+        generation = cache.generation("XYZ")
+        cache.purge_consumer("XYZ")
+        cache.set_decision(key, True, generation)
+        self.assertEquals(None, cache.get(key))
+
+        generation = cache.generation("XYZ")
+        cache.set_decision(key, True, generation)
+        self.assertEquals(True, cache.get(key))
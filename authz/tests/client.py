@@ -0,0 +1,177 @@
+import time
+import json
+import unittest
+import oauth2 as oauth
+
+import httplib2
+
+from authz.client import AuthzClient, ServiceError
+from fixtures import TEST_CONSUMERS, TEST_POLICIES
+
+__all__ = ('AuthzClientTestCase',)
+
+
+class FakeHttp(object):
+    """Fake httplib2.Http serving the fixtures through the REST API URLs.
+
+    The policies are served in pages of page_size policies. Every other
+    request is recorded and answered with the remote_status.
+    """
+
+    def __init__(self, page_size=2):
+        self.remote_status = 200
+        self.fail = False
+        self.requests = []
+        self.documents = {}
+        for consumer in TEST_CONSUMERS:
+            prefix = "/api/1.0/consumers/%s/" % consumer["key"]
+            self.documents["http://authz" + prefix] = consumer
+
+            policies = [
+                {"rid": policy["rid"], "actions": list(policy["actions"])}
+                for policy in TEST_POLICIES
+                if policy["consumer_key"] == consumer["key"]]
+            url = prefix + "policies/"
+            for start in xrange(0, len(policies) or 1, page_size):
+                page = policies[start:start + page_size]
+                next_url = None
+                if start + page_size < len(policies):
+                    next_url = "%spolicies/?limit=%d&after=%s" % (
+                        prefix, page_size, page[-1]["rid"])
+
+                self.documents["http://authz" + url] = {
+                    "objects": page, "next": next_url}
+                url = next_url
+
+    def request(self, uri, method="GET", body=None, headers=None):
+        if self.fail:
+            raise httplib2.ServerNotFoundError("authz")
+
+        if uri in self.documents:
+            return (httplib2.Response({"status": 200}),
+                    json.dumps(self.documents[uri]))
+        if uri.startswith("http://authz/api/1.0/"):
+            return httplib2.Response({"status": 404}), ""
+
+        self.requests.append((method, uri))
+        return httplib2.Response({"status": self.remote_status}), ""
+
+
+def _sign(key, secret, method, url, body=""):
+    """Return the Authorization header of an OAuth signed request."""
+    request = oauth.Request(
+        method=method,
+        url=url,
+        body=body,
+        parameters={
+            'oauth_version': "1.0",
+            'oauth_nonce': oauth.generate_nonce(),
+            'oauth_timestamp': int(time.time()),
+            'oauth_consumer_key': key,
+        })
+    request.sign_request(
+        oauth.SignatureMethod_HMAC_SHA1(), oauth.Consumer(key, secret), None)
+    return request.to_header()
+
+
+class AuthzClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeHttp()
+        self.client = AuthzClient(
+            "http://authz/", ["XYZ", "ABC", "MISSING"], http=self.http)
+
+    def test_authorize(self):
+        authorize = self.client.authorize
+        self.assertEquals(
+            202, authorize("XYZ", "pbs:api", "program/test-program", "put"))
+        self.assertEquals(
+            403, authorize("XYZ", "pbs:api", "program/test-program", "post"))
+        self.assertEquals(
+            202, authorize("XYZ", "pbs:api", "/station/utmedia/", "DELETE"))
+        self.assertEquals(
+            202, authorize("ABC", "pbs:api", "station/utmedia", "get"))
+        self.assertEquals(
+            403, authorize("ABC", "pbs:api", "station/utmedia", "put"))
+        self.assertEquals(
+            400, authorize("ABC", "pbs:api", "station//utmedia", "get"))
+        self.assertEquals(
+            401, authorize("MISSING", "pbs:api", "station/utmedia", "get"))
+        self.assertEquals([], self.http.requests)
+
+    def test_authorize_not_synced_consumer(self):
+        self.http.remote_status = 403
+        self.assertEquals(403, self.client.authorize(
+            "DEF", "pbs:api", "program/nova", "put"))
+        self.assertEquals(
+            [("PUT", "http://authz/authorize/DEF/pbs%3Aapi/program/nova/")],
+            self.http.requests)
+
+    def test_stale_data(self):
+        self.client.authorize("ABC", "pbs:api", "station/utmedia", "get")
+        self.client.max_age = 0
+        self.client._synced_at -= 1
+        self.http.fail = True
+        self.assertRaises(
+            ServiceError, self.client.authorize,
+            "ABC", "pbs:api", "station/utmedia", "get")
+
+        # the sync is retried only after the retry interval
+        self.http.fail = False
+        self.http.remote_status = 202
+        self.assertEquals(202, self.client.authorize(
+            "ABC", "pbs:api", "station/utmedia", "get"))
+        self.assertEquals(1, len(self.http.requests))
+
+        self.client._retry_at = 0
+        self.client.max_age = 60
+        self.assertEquals(403, self.client.authorize(
+            "ABC", "pbs:api", "station/utmedia", "put"))
+        self.assertEquals(1, len(self.http.requests))
+
+    def test_authenticate(self):
+        url = "http://api.pbs.org/1.0/stations/?format=json"
+        headers = _sign("XYZ", "ZYX", "GET", url)
+        status, consumer = self.client.authenticate("GET", url, headers)
+        self.assertEquals(202, status)
+        self.assertEquals({"name": "Consumer XYZ", "key": "XYZ"}, consumer)
+
+        headers = _sign("XYZ", "wrong", "GET", url)
+        self.assertEquals(
+            (401, None), self.client.authenticate("GET", url, headers))
+        self.assertEquals(
+            (401, None), self.client.authenticate("GET", url, {}))
+
+        headers = _sign("MISSING", "secret", "GET", url)
+        self.assertEquals(
+            (401, None), self.client.authenticate("GET", url, headers))
+        self.assertEquals([], self.http.requests)
+
+    def test_authenticate_replayed(self):
+        url = "http://api.pbs.org/1.0/stations/"
+        headers = _sign("ABC", "CBA", "GET", url)
+        self.assertEquals(
+            202, self.client.authenticate("GET", url, headers)[0])
+        self.assertEquals(
+            (401, None), self.client.authenticate("GET", url, headers))
+
+    def test_authenticate_body_hash(self):
+        url = "http://api.pbs.org/1.0/stations/"
+        body = json.dumps({"title": "Test Station", "tvcode": "TSTA"})
+        headers = _sign("XYZ", "ZYX", "POST", url, body)
+        headers["Content-Type"] = "application/json"
+
+        status, consumer = self.client.authenticate(
+            "POST", url, headers, body)
+        self.assertEquals(202, status)
+        self.assertEquals(
+            (401, None),
+            self.client.authenticate("POST", url, headers, body + " "))
+
+    def test_authenticate_not_synced_consumer(self):
+        url = "http://api.pbs.org/1.0/stations/"
+        headers = _sign("DEF", "FED", "PUT", url)
+        self.http.remote_status = 401
+        self.assertEquals(
+            (401, None), self.client.authenticate("PUT", url, headers))
+        self.assertEquals(1, len(self.http.requests))
+        self.assertEquals("PUT", self.http.requests[0][0])
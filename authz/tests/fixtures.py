@@ -25,5 +25,15 @@ TEST_POLICIES = [
         "consumer_key": "ABC",
         "rid": "rid:pbs:api:station/*",
         "actions": set(["get"])
+    },
+    {
+        "consumer_key": "DEF",
+        "rid": "rid:pbs:api:station/42/schedule/*",
+        "actions": set(["get", "put"])
+    },
+    {
+        "consumer_key": "DEF",
+        "rid": "rid:pbs:api:program/**",
+        "actions": set(["get"])
     }
 ]
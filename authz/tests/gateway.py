@@ -0,0 +1,97 @@
+import oauth2 as oauth
+
+from flask import url_for, json
+
+from authz.models import Consumer, Policy
+from authenticate import _build_request
+from base import AuthzTestCase
+from fixtures import TEST_CONSUMERS, TEST_POLICIES
+
+__all__ = ('GatewayTestCase', 'IndexedGatewayTestCase')
+
+
+class GatewayTestCase(AuthzTestCase):
+    def setUp(self):
+        super(GatewayTestCase, self).setUp()
+
+        # Create test data
+        with self.app.test_request_context():
+            for consumer in TEST_CONSUMERS:
+                Consumer(**consumer).save()
+
+            for policy in TEST_POLICIES:
+                Policy(**policy).save()
+
+    def _url(self, consumer, method, request_url):
+        """Return the gateway URL for the signed request."""
+        request_url = _build_request(consumer, method, request_url)
+        with self.app.test_request_context():
+            return url_for(
+                'gateway_endpoints.index', service="pbs:api", url=request_url)
+
+    def test_not_authenticated(self):
+        consumer = oauth.Consumer(key="XYZ", secret="ABC")
+        url = self._url(
+            consumer, "GET", "http://api.pbs.org/station/utmedia/")
+
+        rv = self.client.get(url)
+        self.assertEquals(401, rv.status_code)
+
+    def test_allowed(self):
+        consumer = oauth.Consumer(key="XYZ", secret="ZYX")
+        url = self._url(
+            consumer, "DELETE",
+            "http://api.pbs.org/station/utmedia/?format=json")
+
+        rv = self.client.delete(url)
+        self.assertEquals(202, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals("XYZ", response["key"])
+        self.assertEquals("Consumer XYZ", response["name"])
+        self.assertEquals("pbs:api", response["service"])
+        self.assertEquals("station/utmedia", response["resource"])
+        self.assertEquals("delete", response["action"])
+        self.assertEquals(202, response["status"])
+
+    def test_forbidden(self):
+        consumer = oauth.Consumer(key="ABC", secret="CBA")
+        url = self._url(
+            consumer, "PUT", "http://api.pbs.org/station/utmedia/")
+
+        rv = self.client.put(url)
+        self.assertEquals(403, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals("ABC", response["key"])
+        self.assertEquals(403, response["status"])
+
+    def test_encoded_resource(self):
+        with self.app.test_request_context():
+            Policy(consumer_key="ABC", rid="rid:pbs:api:program/a b",
+                   actions=set(["get"])).save()
+
+        consumer = oauth.Consumer(key="ABC", secret="CBA")
+        url = self._url(consumer, "GET", "http://api.pbs.org/program/a%20b/")
+
+        rv = self.client.get(url)
+        self.assertEquals(202, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals("program/a b", response["resource"])
+
+    def test_invalid_resource(self):
+        consumer = oauth.Consumer(key="ABC", secret="CBA")
+        url = self._url(consumer, "GET", "http://api.pbs.org/")
+
+        rv = self.client.get(url)
+        self.assertEquals(400, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals("ABC", response["key"])
+        self.assertEquals("", response["resource"])
+
+
+class IndexedGatewayTestCase(GatewayTestCase):
+    """Run the gateway tests against the in-process policy index."""
+    POLICY_INDEX_ENABLED = True
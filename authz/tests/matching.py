@@ -0,0 +1,113 @@
+import unittest
+
+from authz.matching import (
+    RidTrie, POLICY_ACTION_BITS, POLICY_ACTION_MASKS, actions_to_mask,
+    rid_filters)
+from fixtures import TEST_POLICIES
+
+__all__ = ('RidFiltersTestCase', 'RidTrieTestCase')
+
+
+class RidFiltersTestCase(unittest.TestCase):
+    def test_actions_to_mask(self):
+        self.assertEquals(0, actions_to_mask([]))
+        self.assertEquals(0, actions_to_mask(["patch"]))
+        self.assertEquals(
+            POLICY_ACTION_BITS["get"] | POLICY_ACTION_BITS["put"],
+            actions_to_mask(["get", "put", "get"]))
+
+    def test_action_masks(self):
+        for action, bit in POLICY_ACTION_BITS.iteritems():
+            masks = POLICY_ACTION_MASKS[action]
+            self.assertEquals(8, len(masks))
+            self.assertTrue(bit in masks)
+            self.assertTrue(actions_to_mask(["get", "post", "put", "delete"])
+                            in masks)
+            self.assertTrue(all(mask & bit for mask in masks))
+
+    def test_single_segment(self):
+        self.assertEquals(
+            set(["rid:mc:stations", "rid:mc:*", "rid:mc:**",
+                 "rid:mc:stations/**"]),
+            set(rid_filters("mc", "stations")))
+
+    def test_deep_resource(self):
+        filters = set(rid_filters("mc", "stations/42/schedules/7"))
+        self.assertEquals(10, len(filters))
+        self.assertTrue("rid:mc:stations/42/schedules/7" in filters)
+        self.assertTrue("rid:mc:stations/42/schedules/*" in filters)
+        self.assertTrue("rid:mc:stations/42/*/*" in filters)
+        self.assertTrue("rid:mc:stations/**" in filters)
+        self.assertTrue("rid:mc:*/*/*/*" in filters)
+        self.assertFalse("rid:mc:stations/*" in filters)
+
+    def test_invalid_resource(self):
+        self.assertRaises(ValueError, rid_filters, "mc", "stations//42")
+        self.assertRaises(ValueError, rid_filters, "mc", "")
+
+
+class RidTrieTestCase(unittest.TestCase):
+    PATTERNS = [
+        ("rid:mc:stations/42/schedules/7", ["delete"]),
+        ("rid:mc:stations/42/schedules/*", ["put"]),
+        ("rid:mc:stations/**", ["get"]),
+        ("rid:mc:*/*", ["post"]),
+        ("rid:mc:*/42", ["delete"]),
+        ("rid:mc:programs/*/**", ["put"]),
+        ("rid:other:**", ["delete"]),
+    ]
+
+    def setUp(self):
+        self.trie = RidTrie()
+        for rid, actions in self.PATTERNS:
+            self.trie.add(rid, actions_to_mask(actions))
+
+    def _expected(self, service, resource):
+        """Evaluate the resource the way the policy query does."""
+        filters = set(rid_filters(service, resource))
+        mask = 0
+        for rid, actions in self.PATTERNS:
+            if rid in filters:
+                mask |= actions_to_mask(actions)
+        return mask
+
+    def test_fixtures(self):
+        trie = RidTrie()
+        for policy in TEST_POLICIES:
+            if policy["consumer_key"] == "XYZ":
+                trie.add(policy["rid"], actions_to_mask(policy["actions"]))
+
+        self.assertEquals(
+            actions_to_mask(["get", "put"]),
+            trie.match("pbs:api", "program/test-program"))
+        self.assertEquals(
+            actions_to_mask(["get", "put", "delete"]),
+            trie.match("pbs:api", "station/utmedia"))
+        self.assertEquals(
+            actions_to_mask(["get"]),
+            trie.match("pbs:api", "topic/science-technology"))
+        self.assertEquals(0, trie.match("pbs:other", "station/utmedia"))
+
+    def test_match_same_as_filters(self):
+        resources = [
+            "stations", "stations/42", "stations/42/schedules",
+            "stations/42/schedules/7", "stations/42/schedules/8",
+            "stations/43/schedules/7", "programs", "programs/nova",
+            "programs/nova/episodes/1", "topics/42", "*/42", "a/b/c/d/e",
+        ]
+        for service in ("mc", "other", "unknown"):
+            for resource in resources:
+                self.assertEquals(
+                    self._expected(service, resource),
+                    self.trie.match(service, resource),
+                    "%s:%s" % (service, resource))
+
+    def test_add_after_match(self):
+        self.assertEquals(0, self.trie.match("mc", "topics/42/a"))
+        self.trie.add("rid:mc:topics/*/*", actions_to_mask(["get"]))
+        self.assertEquals(
+            actions_to_mask(["get"]),
+            self.trie.match("mc", "topics/42/a"))
+
+    def test_invalid_resource(self):
+        self.assertRaises(ValueError, self.trie.match, "mc", "stations//42")
@@ -0,0 +1,95 @@
+import time
+import unittest
+
+from authz.application import mongo
+from authz.nonces import MemoryNonceStore, MongoNonceStore, NonceChecker
+from base import AuthzTestCase
+
+__all__ = ('MemoryNonceStoreTestCase', 'MongoNonceStoreTestCase')
+
+
+class MemoryNonceStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryNonceStore(window=300, bucket_size=60)
+
+    def test_replay(self):
+        self.assertTrue(self.store.add("ABC", "nonce", 1000, now=1000))
+        self.assertFalse(self.store.add("ABC", "nonce", 1000, now=1001))
+        self.assertTrue(self.store.add("ABC", "nonce", 1001, now=1001))
+        self.assertTrue(self.store.add("DEF", "nonce", 1000, now=1001))
+        self.assertTrue(self.store.add("ABC", "other", 1000, now=1001))
+
+    def test_eviction(self):
+        self.store.add("ABC", "first", 1000, now=1000)
+        self.store.add("ABC", "second", 1100, now=1100)
+        self.assertEquals(2, len(self.store))
+
+        # the nonces are kept while their timestamps are accepted
+        self.assertFalse(self.store.add("ABC", "first", 1000, now=1300))
+        self.assertEquals(2, len(self.store))
+
+        self.store.add("ABC", "third", 1380, now=1380)
+        self.assertEquals(2, len(self.store))
+        self.assertFalse(self.store.add("ABC", "second", 1100, now=1380))
+
+    def test_checker(self):
+        timestamp = int(time.time())
+        checker = NonceChecker()
+        self.assertTrue(checker.add("ABC", "nonce", timestamp))
+        self.assertTrue(checker.add("ABC", "nonce", timestamp))
+
+        checker.store = self.store
+        self.assertTrue(checker.add("ABC", "nonce", timestamp))
+        self.assertFalse(checker.add("ABC", "nonce", timestamp))
+        self.assertFalse(checker.add("ABC", None, timestamp))
+
+
+class MongoNonceStoreTestCase(AuthzTestCase):
+    def setUp(self):
+        super(MongoNonceStoreTestCase, self).setUp()
+        self.collection = mongo.session.db['NonceTest']
+        self.store = MongoNonceStore(
+            lambda: self.collection, batch_size=2, flush_interval=60)
+
+    def tearDown(self):
+        self.collection.drop()
+        super(MongoNonceStoreTestCase, self).tearDown()
+
+    def test_batched_inserts(self):
+        now = int(time.time())
+        self.assertTrue(self.store.add("ABC", "first", now, now=now))
+        self.assertEquals(0, self.collection.count())
+
+        self.assertTrue(self.store.add("ABC", "second", now, now=now))
+        self.assertEquals(2, self.collection.count())
+
+        self.assertTrue(self.store.add("ABC", "third", now, now=now))
+        self.store.flush(now)
+        self.assertEquals(3, self.collection.count())
+
+    def test_periodic_flush(self):
+        store = MongoNonceStore(
+            lambda: self.collection, batch_size=100, flush_interval=0.1)
+        self.assertTrue(store.add("ABC", "nonce", int(time.time())))
+        self.assertEquals(0, self.collection.count())
+
+        # the nonce is written without any other request
+        time.sleep(0.5)
+        self.assertEquals(1, self.collection.count())
+
+    def test_prune_expired(self):
+        now = int(time.time())
+        self.store.add("ABC", "old", now - 1000, now=now)
+        self.store.add("ABC", "new", now, now=now)
+        self.assertEquals(
+            ["new"],
+            [document["nonce"] for document in self.collection.find()])
+
+    def test_replay_from_other_process(self):
+        now = int(time.time())
+        self.store.add("ABC", "nonce", now, now=now)
+        self.store.flush(now)
+
+        other = MongoNonceStore(lambda: self.collection)
+        self.assertFalse(other.add("ABC", "nonce", now, now=now))
+        self.assertTrue(other.add("ABC", "nonce", now + 1, now=now + 1))
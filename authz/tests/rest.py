@@ -1,10 +1,11 @@
 from flask import url_for, json
 
-from authz.models import Consumer, Policy
+from authz.models import Consumer, Policy, actions_to_mask
+from authz.cache import get_consumer
 from base import AuthzTestCase
 from fixtures import TEST_CONSUMERS, TEST_POLICIES
 
-__all__ = ('ConsumersApiTestCase', 'PoliciesApiTestCase')
+__all__ = ('ConsumersApiTestCase', 'PoliciesApiTestCase', 'AccessApiTestCase')
 
 
 class ConsumersApiTestCase(AuthzTestCase):
@@ -25,6 +26,79 @@ class ConsumersApiTestCase(AuthzTestCase):
 
         response = json.loads(rv.data)
         self.assertEquals(3, len(response["objects"]))
+        self.assertEquals(None, response["next"])
+
+    def test_get_consumers_pages(self):
+        with self.app.test_request_context():
+            url = url_for('rest_endpoints.consumers', limit=2)
+
+        rv = self.client.get(url)
+        self.assertEquals(200, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals(
+            ["ABC", "DEF"], [obj["key"] for obj in response["objects"]])
+
+        rv = self.client.get(response["next"])
+        self.assertEquals(200, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals(["XYZ"], [obj["key"] for obj in response["objects"]])
+        self.assertEquals(None, response["next"])
+
+    def test_stream_consumers(self):
+        with self.app.test_request_context():
+            url = url_for('rest_endpoints.consumers', format="ndjson")
+
+        rv = self.client.get(url)
+        self.assertEquals(200, rv.status_code)
+        self.assertEquals("application/x-ndjson", rv.mimetype)
+
+        objects = [json.loads(line) for line in rv.data.splitlines()]
+        self.assertEquals(
+            ["ABC", "DEF", "XYZ"], [obj["key"] for obj in objects])
+        self.assertEquals("Consumer ABC", objects[0]["name"])
+        self.assertTrue("resource_uri" in objects[0])
+
+    def test_get_consumers_invalid_limit(self):
+        for limit in ("invalid", "0", "-1"):
+            with self.app.test_request_context():
+                url = url_for('rest_endpoints.consumers', limit=limit)
+
+            rv = self.client.get(url)
+            self.assertEquals(400, rv.status_code)
+
+    def test_get_consumers_fields(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'rest_endpoints.consumers', fields="key,policies", limit=2)
+            policies_url = url_for(
+                'rest_endpoints.policies', consumer_key="ABC")
+
+        rv = self.client.get(url)
+        self.assertEquals(200, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals(
+            {"key": "ABC", "policies": policies_url},
+            response["objects"][0])
+
+        # the next page has the same fields
+        rv = self.client.get(response["next"])
+        self.assertEquals(200, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals(
+            [["key", "policies"]],
+            [sorted(obj) for obj in response["objects"]])
+
+    def test_get_consumers_invalid_fields(self):
+        for fields in ("invalid", "key,secret,invalid", ","):
+            with self.app.test_request_context():
+                url = url_for('rest_endpoints.consumers', fields=fields)
+
+            rv = self.client.get(url)
+            self.assertEquals(400, rv.status_code)
 
     def test_get_single_consumer(self):
         with self.app.test_request_context():
@@ -36,6 +110,26 @@ class ConsumersApiTestCase(AuthzTestCase):
         response = json.loads(rv.data)
         self.assertEquals("DEF", response['key'])
 
+    def test_get_consumer_not_modified(self):
+        with self.app.test_request_context():
+            url = url_for('rest_endpoints.consumers', consumer_key="XYZ")
+
+        rv = self.client.get(url)
+        self.assertEquals(200, rv.status_code)
+        etag = rv.headers["ETag"]
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEquals(304, rv.status_code)
+
+        rv = self.client.put(
+            url, data=json.dumps({"name": "Updated XYZ"}),
+            content_type="application/json")
+        self.assertEquals(200, rv.status_code)
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEquals(200, rv.status_code)
+        self.assertEquals("Updated XYZ", json.loads(rv.data)["name"])
+
     def test_create_consumer_without_name(self):
         with self.app.test_request_context():
             url = url_for('rest_endpoints.consumers')
@@ -86,6 +180,50 @@ class ConsumersApiTestCase(AuthzTestCase):
         self.assertEquals("XYZ", response["key"])
         self.assertEquals("Test Consumer Changed", response["name"])
 
+    def test_patch_consumer(self):
+        with self.app.test_request_context():
+            url = url_for('rest_endpoints.consumers', consumer_key='XYZ')
+
+        rv = self.client.open(
+            url, method="PATCH",
+            data=json.dumps({"name": "Test Consumer Changed"}),
+            content_type="application/json")
+        self.assertEquals(200, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals("XYZ", response["key"])
+        self.assertEquals("Test Consumer Changed", response["name"])
+        self.assertEquals("ZYX", response["secret"])
+
+        for payload in ({}, {"key": "IJH"}, {"name": "X" * 31}):
+            rv = self.client.open(
+                url, method="PATCH", data=json.dumps(payload),
+                content_type="application/json")
+            self.assertEquals(400, rv.status_code)
+
+        with self.app.test_request_context():
+            url = url_for('rest_endpoints.consumers', consumer_key='MISSING')
+
+        rv = self.client.open(
+            url, method="PATCH", data=json.dumps({"name": "Missing"}),
+            content_type="application/json")
+        self.assertEquals(404, rv.status_code)
+
+    def test_update_consumer_invalidates_cache(self):
+        with self.app.test_request_context():
+            url = url_for('rest_endpoints.consumers', consumer_key='XYZ')
+            self.assertEquals("Consumer XYZ", get_consumer("XYZ").name)
+
+        payload = json.dumps({"name": "Test Consumer Changed"})
+        rv = self.client.put(
+            url, data=payload,
+            content_type="application/json")
+        self.assertEquals(200, rv.status_code)
+
+        with self.app.test_request_context():
+            consumer = get_consumer("XYZ")
+            self.assertEquals("Test Consumer Changed", consumer.name)
+
     def test_delete_invalid_consumer(self):
         with self.app.test_request_context():
             url = url_for('rest_endpoints.consumers', consumer_key='TUV')
@@ -104,6 +242,17 @@ class ConsumersApiTestCase(AuthzTestCase):
         rv = self.client.get(url)
         self.assertEquals(404, rv.status_code)
 
+    def test_delete_consumer_invalidates_cache(self):
+        with self.app.test_request_context():
+            url = url_for('rest_endpoints.consumers', consumer_key='DEF')
+            self.assertTrue(get_consumer("DEF"))
+
+        rv = self.client.delete(url)
+        self.assertEquals(204, rv.status_code)
+
+        with self.app.test_request_context():
+            self.assertEquals(None, get_consumer("DEF"))
+
 
 class PoliciesApiTestCase(AuthzTestCase):
     def setUp(self):
@@ -129,6 +278,86 @@ class PoliciesApiTestCase(AuthzTestCase):
         response = json.loads(rv.data)
         self.assertEquals(3, len(response["objects"]))
 
+    def test_get_policies_pages(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="XYZ",
+                limit=1)
+
+        rids = []
+        while url:
+            rv = self.client.get(url)
+            self.assertEquals(200, rv.status_code)
+
+            response = json.loads(rv.data)
+            self.assertEquals(1, len(response["objects"]))
+            rids.append(response["objects"][0]["rid"])
+            url = response["next"]
+
+        self.assertEquals(
+            sorted(policy["rid"] for policy in TEST_POLICIES
+                   if policy["consumer_key"] == "XYZ"),
+            rids)
+
+    def test_stream_policies(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="XYZ",
+                format="ndjson",
+                after="rid:pbs:api:program/*")
+
+        rv = self.client.get(url)
+        self.assertEquals(200, rv.status_code)
+
+        rids = [json.loads(line)["rid"] for line in rv.data.splitlines()]
+        self.assertEquals(
+            sorted(policy["rid"] for policy in TEST_POLICIES
+                   if policy["consumer_key"] == "XYZ" and
+                   policy["rid"] > "rid:pbs:api:program/*"),
+            rids)
+
+    def test_get_policies_not_modified(self):
+        with self.app.test_request_context():
+            url = url_for('rest_endpoints.policies', consumer_key="XYZ")
+            policy_url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="XYZ",
+                rid="rid:pbs:api:station/*")
+
+        rv = self.client.get(url)
+        self.assertEquals(200, rv.status_code)
+        etag = rv.headers["ETag"]
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEquals(304, rv.status_code)
+        self.assertEquals("", rv.data)
+        self.assertEquals(etag, rv.headers["ETag"])
+
+        rv = self.client.put(
+            policy_url, data=json.dumps({"actions": ["get"]}),
+            content_type="application/json")
+        self.assertEquals(200, rv.status_code)
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEquals(200, rv.status_code)
+        self.assertNotEquals(etag, rv.headers["ETag"])
+
+        # the policies of other consumers don't change the revision
+        etag = rv.headers["ETag"]
+        with self.app.test_request_context():
+            other_url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="ABC",
+                rid="rid:pbs:api:station/*")
+
+        rv = self.client.delete(other_url)
+        self.assertEquals(204, rv.status_code)
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEquals(304, rv.status_code)
+
     def test_get_single_policy(self):
         with self.app.test_request_context():
             url = url_for(
@@ -146,6 +375,23 @@ class PoliciesApiTestCase(AuthzTestCase):
             set(["get", "put", "delete"]),
             set(response["actions"]))
 
+    def test_get_single_policy_fields(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="XYZ",
+                rid="rid:pbs:api:station/*",
+                fields="actions")
+
+        rv = self.client.get(url)
+        self.assertEquals(200, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals(["actions"], response.keys())
+        self.assertEquals(
+            set(["get", "put", "delete"]),
+            set(response["actions"]))
+
     def test_get_policies_through_consumer(self):
         with self.app.test_request_context():
             url = url_for(
@@ -218,6 +464,19 @@ class PoliciesApiTestCase(AuthzTestCase):
         self.assertEquals(set(["get", "put"]), set(response["actions"]))
         self.assertTrue("consumer" in response)
 
+    def test_create_duplicate_policy(self):
+        with self.app.test_request_context():
+            url = url_for('rest_endpoints.policies', consumer_key="XYZ")
+
+        payload = json.dumps({
+            "rid": "rid:pbs:api:station/*",
+            "actions": ["get"]})
+        rv = self.client.post(
+            url, data=payload,
+            content_type="application/json")
+        self.assertEquals(409, rv.status_code)
+        self.assertContains(rv, "Policy already exists")
+
     def test_update_policy_invalid_consumer(self):
         with self.app.test_request_context():
             url = url_for(
@@ -258,6 +517,111 @@ class PoliciesApiTestCase(AuthzTestCase):
             set(response["actions"]))
         self.assertTrue("consumer" in response)
 
+        with self.app.test_request_context():
+            policy = Policy.query.filter(
+                Policy.consumer_key == "XYZ",
+                Policy.rid == "rid:pbs:api:station/*").first()
+            self.assertEquals(
+                actions_to_mask(["get", "post", "put"]), policy.actions_mask)
+
+    def test_patch_policy(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="XYZ",
+                rid="rid:pbs:api:station/*")
+
+        for payload, actions in (
+                ({"add_actions": ["post", "get"]},
+                 ["get", "post", "put", "delete"]),
+                ({"remove_actions": ["get", "delete"]}, ["post", "put"]),
+                ({"actions": ["get"]}, ["get"])):
+            rv = self.client.open(
+                url, method="PATCH", data=json.dumps(payload),
+                content_type="application/json")
+            self.assertEquals(200, rv.status_code)
+
+            response = json.loads(rv.data)
+            self.assertEquals("rid:pbs:api:station/*", response["rid"])
+            self.assertEquals(set(actions), set(response["actions"]))
+
+            with self.app.test_request_context():
+                policy = Policy.query.filter(
+                    Policy.consumer_key == "XYZ",
+                    Policy.rid == "rid:pbs:api:station/*").first()
+                self.assertEquals(set(actions), policy.actions)
+                self.assertEquals(
+                    actions_to_mask(actions), policy.actions_mask)
+
+    def test_patch_policy_invalid(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="XYZ",
+                rid="rid:pbs:api:station/*")
+            missing_url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="XYZ",
+                rid="rid:pbs:api:missing/*")
+
+        for payload in ({}, {"actions": ["fly"]}, {"actions": "get"},
+                        {"actions": ["get"], "add_actions": ["put"]}):
+            rv = self.client.open(
+                url, method="PATCH", data=json.dumps(payload),
+                content_type="application/json")
+            self.assertEquals(400, rv.status_code)
+
+        rv = self.client.open(
+            missing_url, method="PATCH",
+            data=json.dumps({"add_actions": ["get"]}),
+            content_type="application/json")
+        self.assertEquals(404, rv.status_code)
+
+    def test_update_policy_invalidates_decisions(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="XYZ",
+                rid="rid:pbs:api:station/*")
+            authorize_url = url_for(
+                'authorize_endpoints.index',
+                consumer_key="XYZ",
+                service="pbs:api",
+                resource="station/utmedia")
+
+        rv = self.client.post(authorize_url)
+        self.assertEquals(403, rv.status_code)
+
+        payload = json.dumps({"actions": ["get", "post"]})
+        rv = self.client.put(
+            url, data=payload,
+            content_type="application/json")
+        self.assertEquals(200, rv.status_code)
+
+        rv = self.client.post(authorize_url)
+        self.assertEquals(202, rv.status_code)
+
+    def test_delete_policy_invalidates_decisions(self):
+        with self.app.test_request_context():
+            url = url_for(
+                'rest_endpoints.policies',
+                consumer_key="XYZ",
+                rid="rid:pbs:api:station/*")
+            authorize_url = url_for(
+                'authorize_endpoints.index',
+                consumer_key="XYZ",
+                service="pbs:api",
+                resource="station/utmedia")
+
+        rv = self.client.delete(authorize_url)
+        self.assertEquals(202, rv.status_code)
+
+        rv = self.client.delete(url)
+        self.assertEquals(204, rv.status_code)
+
+        rv = self.client.delete(authorize_url)
+        self.assertEquals(403, rv.status_code)
+
     def test_delete_policy_invalid_consumer(self):
         with self.app.test_request_context():
             url = url_for(
@@ -290,3 +654,68 @@ class PoliciesApiTestCase(AuthzTestCase):
 
         rv = self.client.get(url)
         self.assertEquals(404, rv.status_code)
+
+
+class AccessApiTestCase(AuthzTestCase):
+    def setUp(self):
+        super(AccessApiTestCase, self).setUp()
+
+        # Create test data
+        with self.app.test_request_context():
+            for consumer in TEST_CONSUMERS:
+                Consumer(**consumer).save()
+
+            for policy in TEST_POLICIES:
+                Policy(**policy).save()
+
+    def _access_url(self, resource, **values):
+        """Return the access endpoint URL for the resource."""
+        with self.app.test_request_context():
+            return url_for(
+                'rest_endpoints.access', service="pbs:api",
+                resource=resource, **values)
+
+    def test_get_access(self):
+        rv = self.client.get(self._access_url("station/utmedia", action="get"))
+        self.assertEquals(200, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals(None, response["next"])
+        self.assertEquals(
+            [("ABC", ["rid:pbs:api:station/*"]),
+             ("XYZ", ["rid:pbs:api:*/*", "rid:pbs:api:station/*"])],
+            [(obj["key"], obj["rids"]) for obj in response["objects"]])
+
+        with self.app.test_request_context():
+            consumer_url = url_for(
+                'rest_endpoints.consumers', consumer_key="ABC")
+        self.assertEquals(consumer_url, response["objects"][0]["consumer"])
+
+        rv = self.client.get(self._access_url("station/utmedia", action="put"))
+        self.assertEquals(200, rv.status_code)
+
+        response = json.loads(rv.data)
+        self.assertEquals(
+            ["XYZ"], [obj["key"] for obj in response["objects"]])
+
+    def test_get_access_pages(self):
+        url = self._access_url("station/utmedia", action="get", limit=1)
+
+        keys = []
+        while url:
+            rv = self.client.get(url)
+            self.assertEquals(200, rv.status_code)
+
+            response = json.loads(rv.data)
+            self.assertEquals(1, len(response["objects"]))
+            keys.append(response["objects"][0]["key"])
+            url = response["next"]
+
+        self.assertEquals(["ABC", "XYZ"], keys)
+
+    def test_get_access_invalid(self):
+        for url in (self._access_url("station/utmedia"),
+                    self._access_url("station/utmedia", action="fly"),
+                    self._access_url("station//utmedia", action="get")):
+            rv = self.client.get(url)
+            self.assertEquals(400, rv.status_code)
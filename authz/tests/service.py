@@ -0,0 +1,60 @@
+import time
+import threading
+import unittest
+from httplib import HTTPConnection
+
+from werkzeug.serving import WSGIRequestHandler
+
+from authz.service import ThreadPoolWSGIServer
+
+__all__ = ('ThreadPoolWSGIServerTestCase',)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ThreadPoolWSGIServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.server = ThreadPoolWSGIServer(
+            "127.0.0.1", 0, self.app, threads=4, handler=QuietHandler)
+        self.port = self.server.socket.getsockname()[1]
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def app(self, environ, start_response):
+        if environ["PATH_INFO"] == "/slow/":
+            self.release.wait(5)
+        start_response("202 ACCEPTED", [("Content-Length", "0")])
+        return [""]
+
+    def _get(self, path):
+        connection = HTTPConnection("127.0.0.1", self.port, timeout=5)
+        connection.request("GET", path)
+        return connection.getresponse().status
+
+    def test_concurrent_requests(self):
+        statuses = []
+        slow = [threading.Thread(target=lambda: statuses.append(
+            self._get("/slow/"))) for i in xrange(3)]
+        for thread in slow:
+            thread.start()
+
+        # a free thread still answers while the others are blocked
+        time.sleep(0.1)
+        self.assertEquals(202, self._get("/fast/"))
+        self.assertEquals([], statuses)
+
+        self.release.set()
+        for thread in slow:
+            thread.join(5)
+        self.assertEquals([202, 202, 202], statuses)
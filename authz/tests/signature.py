@@ -0,0 +1,180 @@
+import hmac
+import time
+import hashlib
+import base64
+import unittest
+from urlparse import parse_qsl
+from StringIO import StringIO
+
+import oauth2 as oauth
+
+from authz.signature import (
+    SignedRequest, SignatureError, HMACStates, hmac_states, sign, verify,
+    body_hash, verify_body_hash)
+
+__all__ = ('SignatureTestCase', 'HMACStatesTestCase')
+
+
+def _sign(method, url, secret="secret", body="", **parameters):
+    """Return an oauth2 request signed for the consumer 'key'."""
+    parameters.setdefault('oauth_version', "1.0")
+    parameters.setdefault('oauth_nonce', oauth.generate_nonce())
+    parameters.setdefault('oauth_timestamp', int(time.time()))
+    parameters.setdefault('oauth_consumer_key', "key")
+    request = oauth.Request(
+        method=method, url=url, body=body, parameters=parameters)
+    request.sign_request(
+        oauth.SignatureMethod_HMAC_SHA1(),
+        oauth.Consumer("key", secret), None)
+    return request
+
+
+class SignatureTestCase(unittest.TestCase):
+    def test_base_string(self):
+        # the example from RFC 5849, section 3.4.1.1
+        request = SignedRequest(
+            "post",
+            "http://EXAMPLE.COM:80/request?b5=%3D%253D&a3=a&c%40=&a2=r%20b",
+            authorization='OAuth realm="Example", '
+                          'oauth_consumer_key="9djdj82h48djs9d2", '
+                          'oauth_token="kkk9d7dh3k39sjv7", '
+                          'oauth_signature_method="HMAC-SHA1", '
+                          'oauth_timestamp="137131201", '
+                          'oauth_nonce="7d8f3e4a", '
+                          'oauth_signature="djosJKDKJSD8743243%2Fjdk33klY%3D"',
+            form=parse_qsl("c2&a3=2+q", keep_blank_values=True))
+
+        self.assertEquals("9djdj82h48djs9d2", request.consumer_key)
+        self.assertEquals(
+            "POST&http%3A%2F%2Fexample.com%2Frequest&a2%3Dr%2520b%26a3%3D2"
+            "%2520q%26a3%3Da%26b5%3D%253D%25253D%26c%2540%3D%26c2%3D%26oauth_"
+            "consumer_key%3D9djdj82h48djs9d2%26oauth_nonce%3D7d8f3e4a%26"
+            "oauth_signature_method%3DHMAC-SHA1%26oauth_timestamp%3D137131201"
+            "%26oauth_token%3Dkkk9d7dh3k39sjv7",
+            request.base_string())
+
+    def test_verify_query(self):
+        signed = _sign("GET", "http://api.pbs.org/1.0/stations/?format=json")
+        request = SignedRequest("GET", signed.to_url())
+        verify(request, "secret")
+        self.assertRaises(SignatureError, verify, request, "wrong")
+
+    def test_verify_header(self):
+        url = "http://api.pbs.org/1.0/stations/?format=json&a=1"
+        signed = _sign("PUT", url)
+        request = SignedRequest(
+            "PUT", url, authorization=signed.to_header()["Authorization"])
+        verify(request, "secret")
+
+        request = SignedRequest(
+            "PUT", url + "&b=3",
+            authorization=signed.to_header()["Authorization"])
+        self.assertRaises(SignatureError, verify, request, "secret")
+
+    def test_verify_form(self):
+        url = "http://api.pbs.org/1.0/stations/"
+        signed = _sign("POST", url, name="test station")
+        form = parse_qsl(signed.to_postdata())
+        verify(SignedRequest("POST", url, form=form), "secret")
+
+        form = [(k, v) for k, v in form if k != "name"]
+        self.assertRaises(
+            SignatureError, verify, SignedRequest("POST", url, form=form),
+            "secret")
+
+    def test_verify_timestamp(self):
+        signed = _sign(
+            "GET", "http://api.pbs.org/", oauth_timestamp=int(time.time()))
+        request = SignedRequest("GET", signed.to_url())
+        verify(request, "secret")
+        self.assertRaises(
+            SignatureError, verify, request, "secret", time.time() + 600)
+        self.assertRaises(
+            SignatureError, verify, request, "secret", time.time() - 600)
+
+    def test_missing_parameters(self):
+        self.assertRaises(
+            SignatureError, verify,
+            SignedRequest("GET", "http://api.pbs.org/"), "secret")
+        self.assertEquals(
+            None, SignedRequest("GET", "http://api.pbs.org/").consumer_key)
+
+        signed = _sign("GET", "http://api.pbs.org/", oauth_version="2.0")
+        self.assertRaises(
+            SignatureError, verify,
+            SignedRequest("GET", signed.to_url()), "secret")
+
+    def test_invalid_header(self):
+        self.assertRaises(
+            SignatureError, SignedRequest, "GET", "http://api.pbs.org/",
+            authorization="OAuth invalid")
+
+    def test_verify_sha256(self):
+        url = ("http://api.pbs.org/1.0/stations/?oauth_consumer_key=key"
+               "&oauth_signature_method=HMAC-SHA256&oauth_timestamp=%d"
+               % time.time())
+        request = SignedRequest("GET", url)
+        request.parameters.append(
+            ("oauth_signature", sign(request, "secret", "HMAC-SHA256")))
+        request.oauth_parameters["oauth_signature"] = \
+            request.parameters[-1][1]
+
+        verify(request, "secret")
+        self.assertRaises(SignatureError, verify, request, "wrong")
+
+        request.oauth_parameters["oauth_signature_method"] = "HMAC-SHA1"
+        self.assertRaises(SignatureError, verify, request, "secret")
+
+    def test_secret_change(self):
+        signed = _sign("GET", "http://api.pbs.org/")
+        request = SignedRequest("GET", signed.to_url())
+        verify(request, "secret")
+
+        # the cached HMAC object is replaced when the secret changes
+        self.assertRaises(SignatureError, verify, request, "changed")
+        verify(request, "secret")
+
+        hmac_states.invalidate("key")
+        verify(request, "secret")
+
+    def test_body_hash(self):
+        body = "0123456789" * 1000
+        expected = base64.b64encode(hashlib.sha1(body).digest())
+        self.assertEquals(expected, body_hash(StringIO(body)))
+        self.assertEquals(
+            expected, body_hash(StringIO(body), chunk_size=7))
+        self.assertEquals(
+            base64.b64encode(hashlib.sha256(body).digest()),
+            body_hash(StringIO(body), "HMAC-SHA256"))
+
+    def test_verify_body_hash(self):
+        body = '{"title": "Test Station"}'
+        signed = _sign("POST", "http://api.pbs.org/1.0/stations/", body=body)
+        request = SignedRequest("POST", signed.to_url())
+        verify(request, "secret")
+        verify_body_hash(request, StringIO(body))
+        self.assertRaises(
+            SignatureError, verify_body_hash, request, StringIO(body[:-1]))
+
+        # the form encoded bodies are covered by the signature
+        request = SignedRequest("POST", signed.to_url(), form=[])
+        verify_body_hash(request, StringIO(body[:-1]))
+
+        # requests without a body hash are accepted
+        request = SignedRequest("GET", "http://api.pbs.org/")
+        verify_body_hash(request, StringIO(body))
+
+
+class HMACStatesTestCase(unittest.TestCase):
+    def test_get(self):
+        states = HMACStates(maxsize=2)
+        first = states.get("a", "secret", hashlib.sha1)
+        first.update("data")
+        second = states.get("a", "secret", hashlib.sha1)
+        self.assertNotEquals(first.digest(), second.digest())
+        self.assertEquals(
+            hmac.new("secret&", "", hashlib.sha1).digest(), second.digest())
+
+        states.get("b", "secret", hashlib.sha1)
+        states.get("c", "secret", hashlib.sha1)
+        self.assertEquals(1, len(states._states))
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from authz.matching import RidTrie, actions_to_mask
+from authz.snapshot import PolicySnapshot, export_snapshot
+from fixtures import TEST_CONSUMERS, TEST_POLICIES
+
+__all__ = ('PolicySnapshotTestCase',)
+
+
+class PolicySnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "policies.snapshot")
+        self.policies = [
+            (policy["consumer_key"], policy["rid"],
+             actions_to_mask(policy["actions"]))
+            for policy in TEST_POLICIES]
+        export_snapshot(
+            self.path,
+            [consumer["key"] for consumer in TEST_CONSUMERS],
+            self.policies)
+        self.snapshot = PolicySnapshot(self.path)
+
+    def tearDown(self):
+        self.snapshot.close()
+        shutil.rmtree(self.directory)
+
+    def test_has_consumer(self):
+        for consumer in TEST_CONSUMERS:
+            self.assertTrue(self.snapshot.has_consumer(consumer["key"]))
+        self.assertFalse(self.snapshot.has_consumer("UNKNOWN"))
+        self.assertFalse(self.snapshot.has_consumer("rid:pbs:api:*/*"))
+
+    def test_is_allowed(self):
+        self.assertTrue(self.snapshot.is_allowed(
+            "XYZ", "pbs:api", "program/test-program", "put"))
+        self.assertFalse(self.snapshot.is_allowed(
+            "XYZ", "pbs:api", "program/test-program", "delete"))
+        self.assertTrue(self.snapshot.is_allowed(
+            "ABC", "pbs:api", "station/utmedia", "get"))
+        self.assertFalse(self.snapshot.is_allowed(
+            "ABC", "pbs:api", "station/utmedia", "put"))
+        self.assertFalse(self.snapshot.is_allowed(
+            "UNKNOWN", "pbs:api", "station/utmedia", "get"))
+
+    def test_same_as_trie(self):
+        resources = [
+            "program", "program/test-program", "program/nova/episodes/1",
+            "station/utmedia", "station/42/schedule/7", "topic/science",
+            "a/b/c",
+        ]
+        for consumer in TEST_CONSUMERS:
+            trie = RidTrie()
+            for consumer_key, rid, mask in self.policies:
+                if consumer_key == consumer["key"]:
+                    trie.add(rid, mask)
+
+            for service in ("pbs:api", "pbs:other"):
+                for resource in resources:
+                    self.assertEquals(
+                        trie.match(service, resource),
+                        self.snapshot.get_mask(
+                            consumer["key"], service, resource),
+                        "%s %s:%s" % (consumer["key"], service, resource))
+
+    def test_invalid_resource(self):
+        self.assertRaises(
+            ValueError, self.snapshot.is_allowed,
+            "XYZ", "pbs:api", "program//test-program", "get")
+
+    def test_replaced_snapshot(self):
+        self.assertFalse(self.snapshot.is_stale())
+        export_snapshot(self.path, ["ABC"], [])
+        self.assertTrue(self.snapshot.is_stale())
+
+        # the old mapping keeps working until it is closed
+        self.assertTrue(self.snapshot.has_consumer("XYZ"))
+
+        snapshot = PolicySnapshot(self.path)
+        try:
+            self.assertFalse(snapshot.has_consumer("XYZ"))
+            self.assertFalse(snapshot.is_allowed(
+                "ABC", "pbs:api", "station/utmedia", "get"))
+        finally:
+            snapshot.close()
+
+    def test_invalid_file(self):
+        with open(self.path, "wb") as fileobj:
+            fileobj.write("not a snapshot file")
+        self.assertRaises(ValueError, PolicySnapshot, self.path)
@@ -50,11 +50,20 @@ setup(
     include_package_data=True,
     setup_requires=['s3sourceuploader',],
     install_requires=dependencies,
+    extras_require={
+        'gevent': ['gevent>=0.13'],
+    },
     dependency_links=dependency_links,
     entry_points={
         'console_scripts': [
             'runserver = authz.web:runserver',
-            'createadmin = authz.admin.auth:create_admin'
+            'runservice = authz.service:runservice',
+            'createadmin = authz.admin.auth:create_admin',
+            'checkindexes = authz.manage:check_indexes',
+            'migrateactions = authz.manage:migrate_actions',
+            'exportsnapshot = authz.manage:export_snapshot',
+            'importpolicies = authz.manage:import_policies',
+            'exportpolicies = authz.manage:export_policies',
         ]
     },
     test_suite='authz',